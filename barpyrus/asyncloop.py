@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+
+import asyncio
+import math
+import signal
+import sys
+
+from barpyrus import core
+from barpyrus import stats
+from barpyrus.core import global_inputs, quit_main_loop
+
+# An alternative to barpyrus.mainloop.main_loop() based on asyncio. The
+# inputs are watched with loop.add_reader(), widget timers run via
+# loop.call_at(), and coroutines returned by click handlers (e.g.
+# HLWMInput.call_async()) run as background tasks instead of blocking the
+# bar. Select it by setting
+#
+#   engine = 'asyncio'
+#
+# in the config.
+
+class AsyncMainLoop:
+    def __init__(self, bars, inputs, frame_interval, coalesce_delay):
+        self.bars = bars
+        self.inputs = inputs
+        self.frame_interval = frame_interval
+        self.coalesce_delay = coalesce_delay
+        self.last_frame = -math.inf
+        self.update_since = 0 # time of the first change not drawn yet
+        self.frame_handle = None # the pending frame
+        self.timer_handle = None # the next widget timeout
+        self.tasks = set()
+
+    async def run(self):
+        self.loop = asyncio.get_running_loop()
+        self.stopped = self.loop.create_future()
+        for signum in [signal.SIGINT, signal.SIGTERM]:
+            self.loop.add_signal_handler(signum, self.signal_quit)
+        # widgets that were created but are not part of any bar have no timers
+        core.global_timers.retain(w for b in self.bars if b.widget for w in b.widget.walk())
+        core.apply_pending_restarts()
+        for x in self.inputs:
+            self.loop.add_reader(x.fileno(), self.process, x)
+        core.run_coroutine.main_loop = self
+        try:
+            self.request_update()
+            self.check_shutdown()
+            await self.stopped
+        finally:
+            core.run_coroutine.main_loop = None
+            for x in self.inputs:
+                self.loop.remove_reader(x.fileno())
+            for task in list(self.tasks):
+                task.cancel()
+
+    def signal_quit(self):
+        quit_main_loop()
+        self.check_shutdown()
+
+    def check_shutdown(self):
+        if core.shutdown_requested() or not all(b.is_running() for b in self.bars):
+            if not self.stopped.done():
+                self.stopped.set_result(None)
+
+    def process(self, x):
+        try:
+            if stats.enabled:
+                stats.count('events ' + type(x).__name__)
+                changed = stats.call('process ' + type(x).__name__, x.process)
+            else:
+                changed = x.process()
+            if changed:
+                self.request_update()
+        except EOFError:
+            print(f"Received EOF from {x}", file=sys.stderr)
+            self.loop.remove_reader(x.fileno())
+            quit_main_loop()
+        self.apply_pending_restarts()
+        self.check_shutdown()
+
+    def apply_pending_restarts(self):
+        # a restarted input reads from a new file descriptor
+        while core.pending_restarts:
+            x = core.pending_restarts.pop(0)
+            if x.proc is not None: # else the first start of a deferred input
+                self.loop.remove_reader(x.fileno())
+            if x.restart():
+                self.request_update()
+            self.loop.add_reader(x.fileno(), self.process, x)
+
+    def request_update(self):
+        if self.frame_handle is not None:
+            return
+        now = self.loop.time()
+        self.update_since = now
+        due = max(now + self.coalesce_delay, self.last_frame + self.frame_interval)
+        self.frame_handle = self.loop.call_at(due, self.draw)
+
+    def draw(self):
+        self.frame_handle = None
+        for bar in self.bars:
+            painter = bar.painter()
+            if stats.enabled:
+                stats.call('frame', painter.planned_widget, bar.widget)
+            else:
+                painter.planned_widget(bar.widget)
+            painter.flush()
+        self.last_frame = self.loop.time()
+        if stats.enabled:
+            stats.record('event to frame', self.last_frame - self.update_since)
+        self.schedule_timeout()
+
+    def schedule_timeout(self):
+        if self.timer_handle is not None:
+            self.timer_handle.cancel()
+            self.timer_handle = None
+        to = core.global_timers.next_deadline()
+        if to is not None:
+            # loop.time() is the monotonic clock, just like in the widgets
+            self.timer_handle = self.loop.call_at(to, self.timeout)
+
+    def timeout(self):
+        self.timer_handle = None
+        if stats.enabled:
+            timers_changed = stats.call('timers', core.global_timers.run_due, self.loop.time())
+        else:
+            timers_changed = core.global_timers.run_due(self.loop.time())
+        if timers_changed:
+            self.request_update()
+        self.apply_pending_restarts()
+        self.schedule_timeout()
+
+    def create_task(self, coro):
+        # see core.run_coroutine()
+        task = self.loop.create_task(coro)
+        self.tasks.add(task)
+        task.add_done_callback(self.task_done)
+        return task
+
+    def task_done(self, task):
+        self.tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            exc = task.exception()
+            print(f"Background task failed: {exc!r}", file=sys.stderr)
+        # the task may have changed something visible
+        self.request_update()
+        self.check_shutdown()
+
+
+def main_loop(bar, inputs = None, frame_interval = 0.016, coalesce_delay = 0.004):
+    """
+    like barpyrus.mainloop.main_loop(), but running on asyncio
+    """
+    if inputs == None:
+        inputs = global_inputs
+    bars = bar if isinstance(bar, list) else [ bar ]
+    mainloop = AsyncMainLoop(bars, inputs, frame_interval, coalesce_delay)
+    asyncio.run(mainloop.run())
+    for b in bars:
+        b.proc.kill()
+    for i in inputs:
+        i.kill()
+    for b in bars:
+        b.proc.wait()
+    if stats.enabled:
+        stats.dump()
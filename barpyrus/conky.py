@@ -8,13 +8,26 @@ import sys
 import select
 import os
 from barpyrus.widgets import Widget
-from barpyrus.core import EventInput, Painter
+from barpyrus.core import EventInput, Painter, request_restart
 from barpyrus.core import TextPainter
 
 class Conky(EventInput):
+    # every line is a complete update of the conky text
+    snapshot = True
     def __init__(self, text='Conky $conky_version', config = { }, lua = ""):
+        self.text = text
+        self.config = config
+        self.lua = lua
         command = [ 'conky', '-c' , '-' ]
         super(Conky,self).__init__(command)
+
+    def start(self):
+        # the config is passed on stdin, so it is written again on restarts
+        super(Conky,self).start()
+        self.write_flushed(self.config_source())
+        self.proc.stdin.close()
+
+    def config_source(self):
         default_config = {
             'out_to_console': 'true',
             'out_to_x': 'false',
@@ -23,24 +36,69 @@ class Conky(EventInput):
             'default_bar_width': '5',
             'use_spacer': 'none',
         }
-        for key,val in config.items():
+        for key,val in self.config.items():
             default_config[key] = val
         config_str = "conky.config = {\n"
         for key,val in default_config.items():
             config_str += "    %s = %s,\n" % (key,str(val))
         config_str += "};\n"
-        config_str += lua + "\n"
+        config_str += self.lua + "\n"
         config_str += "conky.text = [[\n"
-        config_str += text
+        config_str += self.text
         config_str += "\n]];\n"
-        self.write_flushed(config_str);
-        self.proc.stdin.close()
+        return config_str
+
+class SharedConky(Conky):
+    """
+    A single conky process for the texts of all ConkyWidgets with the same
+    config and lua code. The texts are joined by a delimiter, and every
+    output line is split into the lines for the individual texts.
+    """
+    delimiter = '\x1f'
+    # the process is started once the texts of all widgets are known
+    start_deferred = True
+
+    def __init__(self, config = { }, lua = ""):
+        self.texts = []
+        self.callbacks = []
+        super(SharedConky,self).__init__(text='', config=config, lua=lua)
+
+    def add_text(self, text, callback):
+        # callback is called with the output line of text
+        self.texts.append(text)
+        self.callbacks.append(callback)
+        self.text = self.delimiter.join(self.texts)
+        # the process is (re-)started once the main loop runs
+        request_restart(self)
+
+    def handle_line(self, line):
+        parts = line.split(self.delimiter)
+        if len(parts) != len(self.callbacks):
+            # output of the process before add_text()
+            return False
+        changed = False
+        for callback, part in zip(self.callbacks, parts):
+            if callback(part) is not False:
+                changed = True
+        return changed
+
+# the SharedConky instances by their config and lua code
+shared_conkys = {}
+
+def shared_conky(config, lua):
+    key = (tuple(sorted((k, str(v)) for k, v in config.items())), lua)
+    if key not in shared_conkys:
+        shared_conkys[key] = SharedConky(config=config, lua=lua)
+    return shared_conkys[key]
 
 class ConkyWidget(Widget):
-    def __init__(self, text='Conky $conky_version', config = { }, lua = ""):
+    cacheable = True
+    def __init__(self, text='Conky $conky_version', config = { }, lua = "", shared = True):
         """
         Show the conky output in a widget.
-        text can be the conky source text or a ConkyGenerator object
+        text can be the conky source text or a ConkyGenerator object.
+        If shared is set, all widgets with the same config and lua
+        code use one conky process.
         """
         super(ConkyWidget,self).__init__()
         self.clickareas = {}
@@ -52,16 +110,22 @@ class ConkyWidget(Widget):
             text = generator.conky_source_text()
             # and remember the clickareas
             self.clickareas = generator.clickareas
-        self.conky = Conky(text=text, config=config, lua=lua)
-        self.conky.callback = lambda line: self.update_label(line)
+        if shared and '\n' not in text:
+            self.conky = shared_conky(config, lua)
+            self.conky.add_text(text, self.update_label)
+        else:
+            self.conky = Conky(text=text, config=config, lua=lua)
+            self.conky.callback = lambda line: self.update_label(line)
 
     def render(self, p):
-        if hasattr(p, 'lemonbar') and p.lemonbar is not None:
-            p.lemonbar.clickareas.update(self.clickareas)
+        if hasattr(p, 'add_clickareas'):
+            p.add_clickareas(self.clickareas)
         p.drawRaw(self.label)
 
     def update_label(self, line):
+        changed = (line != self.label)
         self.label = line
+        return changed
 
     def eventinputs(self):
         return [ self.conky ]
@@ -130,7 +194,7 @@ class ConkyGenerator:
         self._in_if = False
         self._cases = None
         # we act as if this ConkyGenerator would be the final lemonbar:
-        self.clickareas = {}
+        self.clickareas = textpainter.clickareas
         self.lemonbar_old_percent_escapes = False
         textpainter.lemonbar = self
 
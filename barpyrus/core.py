@@ -8,10 +8,49 @@ import os
 import math
 import struct
 import contextlib
+import asyncio
+import heapq
+import itertools
+import selectors
 
 
 global_inputs = [ ]
 
+class InputSelector:
+    """
+    The inputs the main loop waits for, registered with a
+    selectors.DefaultSelector (i.e. epoll on Linux) once instead of
+    passing all of them to select() on every wakeup.
+    """
+    def __init__(self, inputs = []):
+        self.selector = selectors.DefaultSelector()
+        self.fds = { } # input -> the file descriptor it is registered with
+        for inp in inputs:
+            self.register(inp)
+
+    def register(self, inp):
+        fd = inp.fileno()
+        self.fds[inp] = fd
+        self.selector.register(fd, selectors.EVENT_READ, inp)
+
+    def unregister(self, inp):
+        fd = self.fds.pop(inp, None)
+        if fd is not None:
+            self.selector.unregister(fd)
+
+    def update(self, inp):
+        # re-register an input if its file descriptor changed, e.g. after
+        # a restart of its process
+        if inp in self.fds and self.fds[inp] != inp.fileno():
+            self.unregister(inp)
+            self.register(inp)
+
+    def select(self, timeout):
+        # returns the inputs that have data
+        return [ key.data for key, _ in self.selector.select(timeout) ]
+
+global_selector = InputSelector()
+
 # ask the main loop to quit soon
 def quit_main_loop():
     shutdown_requested.value = True
@@ -23,15 +62,144 @@ shutdown_requested.value = False
 
 def add_global_input(inp):
     global_inputs.append(inp)
+    global_selector.register(inp)
+
+# inputs whose process has to be restarted before the main loop waits again
+pending_restarts = [ ]
+
+def request_restart(inp):
+    if inp not in pending_restarts:
+        pending_restarts.append(inp)
+
+def apply_pending_restarts():
+    # returns the restarted inputs and whether a restart changed anything
+    # visible
+    restarted = [ ]
+    changed = False
+    while pending_restarts:
+        inp = pending_restarts.pop(0)
+        if inp.restart():
+            changed = True
+        restarted.append(inp)
+    return restarted, changed
+
+# run a coroutine, e.g. one returned by a click handler. In the asyncio main
+# loop, it runs as a background task, otherwise it is run to completion.
+def run_coroutine(coro):
+    if run_coroutine.main_loop is None:
+        return asyncio.run(coro)
+    return run_coroutine.main_loop.create_task(coro)
+run_coroutine.main_loop = None
+
+class TimerQueue:
+    """
+    The deadlines of all widget timers in a min-heap, such that the main
+    loop only looks at the timers that are due. Widgets (re-)schedule
+    themselves when their timer_interval is set. When the main loop starts,
+    it only keeps the timers of the widgets its bars may draw.
+
+    A timer may run up to 'slack' seconds after its deadline. The main loop
+    waits until the earliest of these latest times, which a second heap
+    provides, and whenever it wakes up, it runs all timers whose deadline
+    has passed. So timers with overlapping windows share one wakeup and one
+    frame.
+    """
+    def __init__(self):
+        # entries [deadline, sequence number, widget, deadline + slack]
+        self.heap = [ ]
+        # pairs (deadline + slack, sequence number, entry)
+        self.latest = [ ]
+        self.entries = { } # widget -> its entry in the heap
+        self.counter = itertools.count()
+
+    def schedule(self, widget, deadline, slack = 0):
+        self.cancel(widget)
+        seq = next(self.counter)
+        entry = [deadline, seq, widget, deadline + slack]
+        self.entries[widget] = entry
+        heapq.heappush(self.heap, entry)
+        heapq.heappush(self.latest, (deadline + slack, seq, entry))
+
+    def cancel(self, widget):
+        entry = self.entries.pop(widget, None)
+        if entry is not None:
+            # removed from both heaps lazily
+            entry[2] = None
+
+    def retain(self, widgets):
+        # cancel the timers of all other widgets, e.g. of those that are not
+        # part of any bar, such that they neither wake the main loop nor
+        # are kept alive by the queue
+        widgets = set(widgets)
+        for widget in list(self.entries):
+            if widget not in widgets:
+                self.cancel(widget)
+
+    def next_deadline(self):
+        # the time until which the main loop may wait
+        while self.latest and self.latest[0][2][2] is None:
+            heapq.heappop(self.latest)
+        return self.latest[0][0] if self.latest else None
+
+    def run_due(self, now):
+        # run all timers that are due and return whether an update is needed
+        changed = False
+        due = [ ]
+        while self.heap and self.heap[0][0] <= now:
+            entry = heapq.heappop(self.heap)
+            if entry[2] is not None:
+                due.append(entry)
+        for entry in due:
+            widget = entry[2]
+            if widget is None or self.entries.get(widget) is not entry:
+                continue # cancelled by a previous timer
+            self.cancel(widget)
+            if widget.handle_timeout(now):
+                changed = True
+        return changed
+
+global_timers = TimerQueue()
 
 class EventInput:
+    # if set, the process is not started before the main loop runs, e.g.
+    # because the command is only complete then
+    start_deferred = False
     def __init__(self, command):
         self.command = command
-        self.proc = subprocess.Popen(command, stdout=subprocess.PIPE,
-                                              stdin=subprocess.PIPE)
-        self._buf = ''
+        self.proc = None
         self.callback = None;
-        add_global_input(self)
+        if self.start_deferred:
+            # started by restart(), and registered with the selector then
+            global_inputs.append(self)
+            request_restart(self)
+        else:
+            self.start()
+            add_global_input(self)
+
+    def start(self):
+        # start the process for the current self.command
+        self.proc = subprocess.Popen(self.command, stdout=subprocess.PIPE,
+                                                   stdin=subprocess.PIPE)
+        # readlines() reads all that is available without blocking
+        os.set_blocking(self.proc.stdout.fileno(), False)
+        self._buf = bytearray()
+
+    def restart(self):
+        # start the new process before killing the old one, such that
+        # no output is missed in between. The output of the old process
+        # is discarded. returns whether anything visible changed
+        if self.proc is None:
+            # the first start of a deferred input
+            self.start()
+            global_selector.register(self)
+            return False
+        old_proc = self.proc
+        self.start()
+        global_selector.update(self)
+        old_proc.kill()
+        old_proc.wait()
+        old_proc.stdout.close()
+        return False
 
     def __str__(self):
         cmd = ' '.join([f"'{word}'" for word in self.command])
@@ -40,26 +208,57 @@ class EventInput:
     def fileno(self):
         return self.proc.stdout.fileno()
     # thanks to http://stackoverflow.com/questions/5486717/python-select-doesnt-signal-all-input-from-pipe
+    read_size = 65536
     def readlines(self):
-        data = os.read(self.proc.stdout.fileno(), 4096).decode('utf-8')
-        if not data:
-            raise EOFError
-        self._buf += data
-        if '\n' not in data:
+        # read everything available and return the complete lines. Only
+        # complete lines are decoded, so a multi-byte character is never
+        # split between two reads.
+        fd = self.proc.stdout.fileno()
+        got_data = False
+        while True:
+            try:
+                data = os.read(fd, self.read_size)
+            except BlockingIOError:
+                break
+            if not data:
+                if not got_data:
+                    raise EOFError
+                break # the EOF is reported on the next call
+            got_data = True
+            self._buf += data
+            if len(data) < self.read_size:
+                break # the pipe is drained
+        end = self._buf.rfind(b'\n')
+        if end < 0:
             return []
-        tmp = self._buf.split('\n')
-        lines, self._buf = tmp[:-1], tmp[-1]
-        return lines
+        with memoryview(self._buf) as view:
+            text = str(view[:end], 'utf-8', 'replace')
+        del self._buf[:end + 1]
+        return text.split('\n')
+    # in snapshot mode, every line replaces the previous one entirely, so
+    # only the last of the lines read at once is handled
+    snapshot = False
     def process(self):
-        for line in self.readlines():
-            self.handle_line(line)
+        # returns whether the input changed anything visible
+        changed = False
+        lines = self.readlines()
+        if self.snapshot:
+            lines = lines[-1:]
+        for line in lines:
+            if self.handle_line(line):
+                changed = True
+        return changed
     def kill(self):
-        self.proc.kill()
+        global_selector.unregister(self)
+        if self.proc is not None:
+            self.proc.kill()
     def is_running(self):
         return self.proc.pid != None
     def handle_line(self,line):
+        # callbacks return False if the line did not change anything
         if self.callback != None:
-            self.callback(line)
+            return self.callback(line) is not False
+        return False
     def write_flushed(self, text):
         self.proc.stdin.write(text.encode('utf-8'))
         self.proc.stdin.flush()
@@ -160,6 +359,16 @@ class Painter:
     def space(self, width): # insert some space of 'width' many units
         pass
 
+    # render caching (see Widget.render_themed). A painter that can replay
+    # previously drawn output returns a segment object from begin_segment()
+    # and accepts it again in replay(). The default painter caches nothing.
+    def begin_segment(self, widget):
+        return None
+    def end_segment(self, segment):
+        return segment
+    def replay(self, segment): # returns whether the segment could be replayed
+        return False
+
     class Clickable:
         def __init__(self, buttons, obj, callback):
             # buttons = a list of mouse button numbers
@@ -199,7 +408,16 @@ def get_mouse_location():
     cmd = 'xdotool getmouselocation'.split(' ')
     proc = subprocess.Popen(cmd, stdout=subprocess.PIPE)
     proc.wait()
-    lines = proc.stdout.read().decode("utf-8").split(' ')
+    return parse_mouse_location(proc.stdout.read())
+
+async def get_mouse_location_async():
+    cmd = 'xdotool getmouselocation'.split(' ')
+    proc = await asyncio.create_subprocess_exec(*cmd, stdout=subprocess.PIPE)
+    stdout, _ = await proc.communicate()
+    return parse_mouse_location(stdout)
+
+def parse_mouse_location(output):
+    lines = output.decode("utf-8").split(' ')
     x = int(lines[0].replace('x:', '', 1))
     y = int(lines[1].replace('y:', '', 1))
     return (x,y)
@@ -213,7 +431,27 @@ class DropdownRofi:
         self.rofi_args = [ ]
         self.default_width = 40
     def spawn(self, lines, additional_args = [ '-p', ''], width = None):
-        (mouse_x, mouse_y) = get_mouse_location()
+        cmd = self.rofi_command(get_mouse_location(), additional_args, width)
+        rofi = subprocess.Popen(cmd,stdout=subprocess.PIPE,stdin=subprocess.PIPE)
+        rofi.stdin.write(self.rofi_input(lines))
+        rofi.stdin.close()
+        rofi.wait()
+
+    async def spawn_async(self, lines, additional_args = [ '-p', ''], width = None):
+        cmd = self.rofi_command(await get_mouse_location_async(), additional_args, width)
+        rofi = await asyncio.create_subprocess_exec(*cmd, stdout=subprocess.PIPE, stdin=subprocess.PIPE)
+        await rofi.communicate(self.rofi_input(lines))
+
+    def rofi_input(self, lines):
+        # rofi reads the \0-separated lines from stdin
+        data = b''
+        for i in lines:
+            data += i.encode('utf-8')
+            data += struct.pack('B', 0)
+        return data
+
+    def rofi_command(self, mouse_location, additional_args, width):
+        (mouse_x, mouse_y) = mouse_location
         if not width:
             width = 100 # some default width
         width = max(width, 101) # width has to be 100 at least (rofi restriction)
@@ -231,10 +469,5 @@ class DropdownRofi:
         cmd += ['-xoffset', str(menu_x), '-yoffset', str(menu_y) ]
         cmd += self.rofi_args
         cmd += additional_args
-        rofi = subprocess.Popen(cmd,stdout=subprocess.PIPE,stdin=subprocess.PIPE)
-        for i in lines:
-            rofi.stdin.write(i.encode('utf-8'))
-            rofi.stdin.write(struct.pack('B', 0))
-        rofi.stdin.close()
-        rofi.wait()
+        return cmd
 
@@ -6,7 +6,9 @@ import sys
 import select
 import os
 import math
+import re
 import struct
+import asyncio
 
 from barpyrus.widgets import Widget
 from barpyrus.widgets import Label
@@ -16,6 +18,9 @@ from barpyrus.widgets import StackedLayout
 from barpyrus.core import EventInput
 from barpyrus.core import Painter
 from barpyrus.core import quit_main_loop
+from barpyrus.core import add_global_input, global_selector
+from barpyrus.core import request_restart
+from barpyrus.core import run_coroutine
 from barpyrus.colors import (
     PURPLE_DARK,
     GREEN_DARK,
@@ -28,24 +33,185 @@ from barpyrus.colors import (
     BG2,
 )
 
+class HLWMIPCClient:
+    """
+    Send commands to herbstluftwm directly via its X11 property based IPC
+    protocol, i.e. do what herbstclient does, but over one persistent X
+    connection instead of one herbstclient process per command. This
+    requires python-xlib.
+    """
+    def __init__(self, display = None, timeout = 10):
+        from Xlib import X, display as xdisplay
+        self.X = X
+        self.display = display if display is not None else xdisplay.Display()
+        self.timeout = timeout # seconds to wait for herbstluftwm's reply
+        atom = self.display.intern_atom
+        self.atom_utf8 = atom('UTF8_STRING')
+        self.atom_args = atom('_HERBST_IPC_ARGS')
+        self.atom_output = atom('_HERBST_IPC_OUTPUT')
+        self.atom_error = atom('_HERBST_IPC_ERROR')
+        self.atom_status = atom('_HERBST_IPC_EXIT_STATUS')
+        self.atom_wakeup = atom('_BARPYRUS_WAKEUP')
+        # events for other windows if the display is shared, e.g. with a
+        # HLWMXInput, which picks them up from here
+        self.foreign_events = []
+        # herbstluftwm recognizes the client window by its class and
+        # executes the command that is written to its _HERBST_IPC_ARGS
+        root = self.display.screen().root
+        self.window = root.create_window(42, 42, 42, 42, 0, X.CopyFromParent)
+        self.window.set_wm_class('HERBST_IPC_CLASS', 'HERBST_IPC_CLASS')
+        self.display.sync()
+        self.window.change_attributes(event_mask=X.PropertyChangeMask)
+
+    def send(self, args):
+        """
+        run a command and return the triple (exit_code, stdout, stderr)
+        """
+        data = b'\0'.join(str(a).encode('utf-8') for a in args)
+        self.window.change_property(self.atom_args, self.atom_utf8, 8, data)
+        self.display.flush()
+        output_received = False
+        status_received = False
+        deadline = time.monotonic() + self.timeout
+        while not (output_received and status_received):
+            event = self.next_event(deadline)
+            if getattr(event, 'window', None) != self.window:
+                self.foreign_events.append(event)
+                continue
+            if event.type != self.X.PropertyNotify \
+                    or event.state != self.X.PropertyNewValue:
+                continue
+            if event.atom == self.atom_output:
+                output_received = True
+            elif event.atom == self.atom_status:
+                status_received = True
+        stdout = self.read_property(self.atom_output)
+        stderr = self.read_property(self.atom_error)
+        prop = self.window.get_full_property(self.atom_status, self.X.AnyPropertyType)
+        exit_code = int(prop.value[0]) if prop else 1
+        while self.display.pending_events() > 0:
+            event = self.display.next_event()
+            if getattr(event, 'window', None) != self.window:
+                self.foreign_events.append(event)
+        if self.foreign_events:
+            # the events are already read from the socket, so select() on
+            # the display won't report them. Provoke another event such
+            # that the owner of the events wakes up.
+            self.window.change_property(self.atom_wakeup, self.atom_utf8, 8, b'')
+            self.display.flush()
+        return (exit_code, stdout, stderr)
+
+    def next_event(self, deadline):
+        while self.display.pending_events() == 0:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0 or not select.select([self.display], [], [], timeout)[0]:
+                raise TimeoutError('herbstluftwm did not reply')
+        return self.display.next_event()
+
+    def read_property(self, atom):
+        prop = self.window.get_full_property(atom, self.X.AnyPropertyType)
+        if prop is None:
+            return ''
+        value = prop.value
+        if isinstance(value, str):
+            return value
+        return bytes(value).decode('utf-8')
+
+    def __call__(self, args, check=True):
+        exit_code, stdout, stderr = self.send(args)
+        if stderr:
+            print(stderr, end='', file=sys.stderr)
+        if check:
+            assert exit_code == 0, \
+                f'Error: command {args} exited with non-success code {exit_code} (and stdout "{stdout}")'
+        return stdout
+
+
+def parse_tag_status(output):
+    # returns the list of tags of a tag_status output or None if the output
+    # is something else, e.g. an error message
+    tags = output.strip('\t\n').split('\t')
+    if not output.startswith('\t') \
+            or not all(len(tag) >= 2 and tag[0] in '.:+#-%!' for tag in tags):
+        return None
+    return tags
+
 class HLWMInput(EventInput):
-    def __init__(self):
-        cmd = [ 'herbstclient', '--idle' ]
+    def __init__(self, native_ipc = False):
+        """
+        if native_ipc is set, commands are sent via a HLWMIPCClient
+        instead of invoking herbstclient
+        """
         self.hooks = { }
-        super(HLWMInput,self).__init__(cmd)
+        self.ipc = HLWMIPCClient() if native_ipc else None
+        self.tag_status_cache = None # monitor -> tag_status list
+        self.tag_status_generation = 0 # the number of invalidations
+        self.tag_status_task = None # (generation, the running async query)
+        self.enhook_quit()
+        # until the main loop starts, the widgets register their hooks and
+        # query the initial state. Print all hooks meanwhile, such that none
+        # fired after such a query is missed. The filter is applied by the
+        # restart requested in update_filter().
+        super(HLWMInput,self).__init__([ 'herbstclient', '--idle' ])
+        self.update_filter()
+    def enhook_quit(self):
         self.enhook('quit_panel', lambda args: quit_main_loop())
         self.enhook('reload', lambda args: quit_main_loop())
     def enhook(self,name,callback):
-        self.hooks.setdefault(name,[]).append(callback)
+        if name not in self.hooks:
+            self.hooks[name] = []
+            self.update_filter()
+        self.hooks[name].append(callback)
+    def idle_command(self):
+        # let herbstclient only print the hooks we have callbacks for
+        hooks = '|'.join(map(re.escape, sorted(self.hooks)))
+        return [ 'herbstclient', '--idle', '^(' + hooks + ')$' ]
+    def update_filter(self):
+        if getattr(self, 'proc', None) is not None:
+            self.command = self.idle_command()
+            request_restart(self)
+    def restart(self):
+        # like EventInput.restart(), but the hooks the old process has
+        # printed until it is killed are handled instead of discarded. Hooks
+        # fired before the new process has connected to herbstluftwm may
+        # still be missed. returns whether the hooks changed anything
+        old_proc, old_buf = self.proc, self._buf
+        self.start()
+        global_selector.update(self)
+        old_proc.kill()
+        old_proc.wait()
+        fd = old_proc.stdout.fileno()
+        while True:
+            try:
+                data = os.read(fd, self.read_size)
+            except BlockingIOError:
+                break
+            if not data:
+                break
+            old_buf += data
+        old_proc.stdout.close()
+        changed = False
+        # an incomplete last line is dropped
+        for line in str(old_buf, 'utf-8', 'replace').split('\n')[:-1]:
+            if self.handle_line(line):
+                changed = True
+        return changed
     def handle_line(self,line):
-        args = line.split('\t')
+        return self.handle_hook(line.split('\t'))
+    def handle_hook(self, args):
+        # args is the hook name followed by its arguments
         if len(args) == 0:
-            return
+            return False
+        changed = False
         if args[0] in self.hooks:
             for cb in self.hooks[args[0]]:
-                cb(args[1:])
+                if cb(args[1:]) is not False:
+                    changed = True
+        return changed
 
     def __call__(self, args, check=True):
+        if self.ipc is not None:
+            return self.ipc(args, check=check)
         cmd = [ "herbstclient", "-n" ]
         cmd += args;
         proc = subprocess.Popen(cmd, stdout=subprocess.PIPE)
@@ -56,6 +222,112 @@ class HLWMInput(EventInput):
                 f'Error: command {args} exited with non-success code {exit_code} (and stdout "{stdout}")'
         return stdout
 
+    async def call_async(self, args, check=True):
+        # like __call__(), but without blocking the asyncio main loop
+        if self.ipc is not None:
+            # no process to wait for
+            return self.ipc(args, check=check)
+        proc = await asyncio.create_subprocess_exec('herbstclient', '-n', *args,
+                                                    stdout=subprocess.PIPE)
+        stdout = (await proc.communicate())[0].decode()
+        if check:
+            assert proc.returncode == 0, \
+                f'Error: command {args} exited with non-success code {proc.returncode} (and stdout "{stdout}")'
+        return stdout
+
+    def tag_status(self, monitor):
+        """
+        return the tag_status of the given monitor as a list. The tag status
+        of all monitors asked for so far is fetched in one query after each
+        burst of tag related hooks, and shared by all HLWMTags widgets.
+        """
+        monitor = str(monitor)
+        self.watch_tag_status(monitor)
+        if self.tag_status_cache[monitor] is None:
+            self.query_tag_status()
+        return self.tag_status_cache[monitor]
+
+    async def tag_status_async(self, monitor):
+        # like tag_status(), but without blocking the asyncio main loop.
+        # Concurrent calls share one query.
+        monitor = str(monitor)
+        self.watch_tag_status(monitor)
+        if self.tag_status_cache[monitor] is not None:
+            return self.tag_status_cache[monitor]
+        if self.tag_status_task is None \
+                or self.tag_status_task[0] != self.tag_status_generation \
+                or self.tag_status_task[1].done():
+            task = asyncio.ensure_future(self.query_tag_status_async())
+            self.tag_status_task = (self.tag_status_generation, task)
+        generation, task = self.tag_status_task
+        statuses = await task
+        if generation == self.tag_status_generation:
+            # no tag related hook since the query started
+            self.tag_status_cache.update(statuses)
+        return statuses.get(monitor, [ ])
+
+    def watch_tag_status(self, monitor):
+        if self.tag_status_cache is None:
+            self.tag_status_cache = { }
+            for event in ['tag_changed', 'tag_flags', 'tag_added', 'tag_removed', 'tag_renamed']:
+                self.enhook(event, self.invalidate_tag_status)
+        if monitor not in self.tag_status_cache:
+            self.tag_status_cache[monitor] = None
+            self.invalidate_tag_status()
+
+    def invalidate_tag_status(self, args = None):
+        for monitor in self.tag_status_cache:
+            self.tag_status_cache[monitor] = None
+        # a query that is running now may miss the changes
+        self.tag_status_generation += 1
+        # nothing visible changed yet
+        return False
+
+    def tag_status_query(self, monitors):
+        # separate the tag_status outputs by lines containing a character
+        # that does not occur in tag names
+        cmd = [ 'chain' ]
+        for monitor in monitors:
+            if len(cmd) > 1:
+                cmd += [ ',', 'echo', self.tag_status_separator ]
+            cmd += [ ',', 'tag_status', monitor ]
+        return cmd
+    tag_status_separator = '\x1f'
+
+    def split_tag_statuses(self, monitors, output):
+        # returns the tag statuses in the output of the tag_status_query()
+        # or None if one is missing. chain continues after a failing
+        # command, so not only the number of outputs is checked, but also
+        # that each is a tag status
+        outputs = output.split(self.tag_status_separator + '\n')
+        statuses = [ parse_tag_status(o) for o in outputs ]
+        if len(statuses) != len(monitors) or None in statuses:
+            return None
+        return statuses
+
+    def query_tag_status(self):
+        monitors = list(self.tag_status_cache)
+        statuses = self.split_tag_statuses(monitors,
+                                           self(self.tag_status_query(monitors), check=False))
+        if statuses is None:
+            # e.g. a monitor has been removed
+            statuses = [ parse_tag_status(self(['tag_status', m], check=False))
+                         for m in monitors ]
+        for monitor, status in zip(monitors, statuses):
+            # no tags for a monitor that doesn't exist (anymore)
+            self.tag_status_cache[monitor] = status if status is not None else [ ]
+
+    async def query_tag_status_async(self):
+        # returns the tag status of every monitor as a dict
+        monitors = list(self.tag_status_cache)
+        output = await self.call_async(self.tag_status_query(monitors), check=False)
+        statuses = self.split_tag_statuses(monitors, output)
+        if statuses is None:
+            statuses = [ parse_tag_status(await self.call_async(['tag_status', m], check=False))
+                         for m in monitors ]
+        return { monitor: status if status is not None else [ ]
+                 for monitor, status in zip(monitors, statuses) }
+
     def monitor_rect(hc, monitor=None):
         if monitor == None:
             if len(sys.argv) >= 2:
@@ -69,8 +341,94 @@ class HLWMInput(EventInput):
         monitor_h = int(geometry[3])
         return (x,y, monitor_w, monitor_h)
 
-def connect():
-    return HLWMInput()
+class HLWMXInput(HLWMInput):
+    """
+    Like HLWMInput, but instead of running 'herbstclient --idle', read the
+    hooks directly from the properties of herbstluftwm's hook window. Pass a
+    python-xlib display to share the X connection with other widgets. The
+    native IPC client (if enabled) uses the same connection.
+    """
+    def __init__(self, native_ipc = True, display = None):
+        from Xlib import X, display as xdisplay
+        self.X = X
+        self.display = display if display is not None else xdisplay.Display()
+        self.command = [ ]
+        self.hooks = { }
+        self.callback = None
+        self.tag_status_cache = None
+        self.tag_status_generation = 0
+        self.tag_status_task = None
+        root = self.display.screen().root
+        prop = root.get_full_property(self.display.intern_atom('__HERBST_HOOK_WIN_ID'),
+                                      X.AnyPropertyType)
+        if prop is None:
+            raise RuntimeError('herbstluftwm is not running')
+        self.hook_window = self.display.create_resource_object('window', int(prop.value[0]))
+        self.hook_window.change_attributes(event_mask=X.PropertyChangeMask | X.StructureNotifyMask)
+        # herbstluftwm writes the hooks to a ring buffer of 10 properties
+        self.hook_atoms = { self.display.intern_atom('__HERBST_HOOK_ARGUMENTS_%d' % i)
+                            for i in range(10) }
+        self.ipc = HLWMIPCClient(self.display) if native_ipc else None
+        self.display.flush()
+        add_global_input(self)
+        self.enhook_quit()
+
+    def update_filter(self):
+        # all hooks arrive anyway, there is no process to restart
+        pass
+
+    def __str__(self):
+        return f'<HLWMXInput display={self.display.get_display_name()}>'
+
+    def fileno(self):
+        return self.display.fileno()
+
+    def process(self):
+        from Xlib import error
+        changed = False
+        try:
+            while True:
+                if self.ipc is not None and self.ipc.foreign_events:
+                    event = self.ipc.foreign_events.pop(0)
+                elif self.display.pending_events() > 0:
+                    event = self.display.next_event()
+                else:
+                    break
+                if self.handle_event(event):
+                    changed = True
+        except error.ConnectionClosedError:
+            raise EOFError
+        return changed
+
+    def handle_event(self, event):
+        if getattr(event, 'window', None) != self.hook_window:
+            return False
+        if event.type == self.X.DestroyNotify:
+            # herbstluftwm has quit
+            raise EOFError
+        if event.type != self.X.PropertyNotify \
+                or event.state != self.X.PropertyNewValue \
+                or event.atom not in self.hook_atoms:
+            return False
+        prop = self.hook_window.get_full_property(event.atom, self.X.AnyPropertyType)
+        if prop is None:
+            return False
+        value = prop.value
+        if not isinstance(value, str):
+            value = bytes(value).decode('utf-8')
+        return self.handle_hook(value.split('\0'))
+
+    def kill(self):
+        global_selector.unregister(self)
+        self.display.close()
+
+    def is_running(self):
+        return True
+
+def connect(native_ipc = False, native_hooks = False):
+    if native_hooks:
+        return HLWMXInput(native_ipc = native_ipc)
+    return HLWMInput(native_ipc = native_ipc)
 
 def underlined_tags(self, painter): # self is a HLWMTagInfo object
     if self.empty:
@@ -179,10 +537,12 @@ class HLWMTagInfo:
         painter.set_flag(painter.overline, False)
 
 class HLWMTags(Widget):
+    cacheable = True
     def __init__(self,hlwm,monitor, tag_renderer = None):
         super(HLWMTags,self).__init__()
         self.hc = hlwm
         self.needs_update = True
+        self.tag_status = [ ] # the last output of tag_status, as a list
         self.tags = [ ]
         self.tag_info = [ ]
         self.tag_count = 0
@@ -192,11 +552,52 @@ class HLWMTags(Widget):
         self.activecolor = hlwm('attr theme.tiling.active.color'.split(' '))
         self.emphbg = GREEN_DARK
         self.update_tags()
-        for event in ['tag_changed', 'tag_flags', 'tag_added', 'tag_removed', 'tag_renamed']:
-            hlwm.enhook(event, self.update_tags)
+        # tag_added and tag_renamed carry enough information to be applied
+        # directly, the other hooks require a new tag_status
+        hlwm.enhook('tag_added', self.tag_added)
+        hlwm.enhook('tag_renamed', self.tag_renamed)
+        for event in ['tag_changed', 'tag_flags', 'tag_removed']:
+            hlwm.enhook(event, self.schedule_update)
+
+    def schedule_update(self, args = None):
+        # query the tag_status only once before the next frame, no
+        # matter how many hooks arrive until then
+        self.needs_update = True
+        return True
+
+    def tag_added(self, args):
+        if self.needs_update or len(args) < 1:
+            return self.schedule_update()
+        # new tags are appended and empty
+        return self.apply_tag_status(self.tag_status + ['.' + args[0]])
+
+    def tag_renamed(self, args):
+        if self.needs_update or len(args) < 2:
+            # old versions of herbstluftwm only report the new name
+            return self.schedule_update()
+        (old_name, new_name) = args[:2]
+        strlist = [ s[0] + new_name if s[1:] == old_name else s for s in self.tag_status ]
+        return self.apply_tag_status(strlist)
+
+    def query_tag_status(self):
+        return self.hc.tag_status(self.monitor)
 
     def update_tags(self, args = None):
-        strlist = self.hc(['tag_status', str(self.monitor)]).strip('\t').split('\t')
+        # returns whether the tag status changed
+        self.needs_update = False
+        return self.apply_tag_status(self.query_tag_status())
+
+    async def update_tags_async(self):
+        # needs_update is reset by render()
+        return self.apply_tag_status(await self.hc.tag_status_async(self.monitor))
+
+    def apply_tag_status(self, strlist):
+        # update the tag buttons to the tag_status given as a list and only
+        # mark those dirty that changed. returns whether anything changed
+        old_strlist = self.tag_status
+        if strlist == old_strlist:
+            return False
+        self.tag_status = strlist
         # remove buttons if tags have been deleted
         if len(strlist) < self.tag_count:
             del self.tags[len(strlist):]
@@ -212,19 +613,31 @@ class HLWMTags(Widget):
                 btn.pre_render = (lambda t: lambda p: self.tag_renderer(t,p))(tag_info)
             else:
                 btn.pre_render = tag_info.render
+            # the tag renderer only reads the tag_info, which is tracked below
+            btn.cacheable = True
             self.tags.append(btn)
             self.subwidgets.append(btn)
             self.tag_info.append(tag_info)
-        # update names and formatting
+        # update names and formatting of the changed tags
         for i in range(0, self.tag_count):
+            if i < len(old_strlist) and old_strlist[i] == strlist[i]:
+                continue
             self.tag_info[i].parse(strlist[i], i)
-        self.needs_update = False
+            self.tags[i].mark_dirty()
+        return True
     def tag_clicked(self,tagindex,button):
         cmd = 'chain , focus_monitor %s , use_index %s' % (str(self.monitor),str(tagindex))
         cmd = cmd.split(' ')
         #print(cmd)
-        self.hc(cmd)
+        return self.hc.call_async(cmd)
     def render(self,painter):
+        if self.needs_update and run_coroutine.main_loop is not None:
+            # don't block the asyncio main loop by the query. The tags
+            # are drawn again when it has finished
+            self.needs_update = False
+            run_coroutine(self.update_tags_async())
+        elif self.needs_update:
+            self.update_tags()
         for t in self.tags:
             painter.widget(t)
     def can_handle_input(self, click_id, btn):
@@ -243,7 +656,7 @@ class HLWMTags(Widget):
         else:
             delta = +1
         cmd = (cmd % (str(self.monitor),delta)).split(' ')
-        self.hc(cmd)
+        return self.hc.call_async(cmd)
 
 class HLWMWindowTitle(Label):
     def __init__(self, hlwm, maxlen = -1):
@@ -255,8 +668,10 @@ class HLWMWindowTitle(Label):
         hlwm.enhook('focus_changed', (lambda a: self.newtitle(a)))
         hlwm.enhook('window_title_changed', (lambda a: self.newtitle(a)))
     def newtitle(self,args):
+        label = self.label
         self.windowtitle = args[1] if len(args) >= 2 else ''
         self.reset_label()
+        return self.label != label
     def reset_label(self):
         if self.maxlen < 0 or len(self.windowtitle) <= self.maxlen:
             self.label = self.windowtitle
@@ -289,15 +704,17 @@ class HLWMLayoutSwitcher(Switcher):
         hlwm.enhook('keyboard_layout', (lambda a: self.layoutswitched(a)))
     def choice_clicked(self,idx):
         l = self.layouts[idx]
-        self.hc(['emit_hook', 'keyboard_layout', l[0]])
         cmd = []
         cmd += self.command
         cmd += l[2:]
         subprocess.Popen(cmd)
+        return self.hc.call_async(['emit_hook', 'keyboard_layout', l[0]])
     def layoutswitched(self,args):
+        selection = self.selection
         for idx, l in enumerate(self.layouts):
             if args[0] == l[0]:
                 self.selection = idx
+        return self.selection != selection
 
 class HLWMMonitorFocusLayout(StackedLayout):
     def __init__(self, hlwm, monitor, wactive, wpassive):
@@ -310,7 +727,9 @@ class HLWMMonitorFocusLayout(StackedLayout):
         super(HLWMMonitorFocusLayout,self).__init__([wpassive, wactive],
             selection = int(self.curmonitor == int(monitor)))
     def anothermonitor(self, args):
+        selection = self.selection
         if len(args) >= 2:
             self.curmonitor = int(args[1])
             self.selection = int(self.curmonitor == self.monitor)
+        return self.selection != selection
 
@@ -1,9 +1,129 @@
 
+import itertools
+import inspect
+import re
+
+from barpyrus import core
+from barpyrus import stats
 from barpyrus.core import EventInput
 from barpyrus.core import TextPainter
 
+# every cached widget gets its own namespace for the names of its click
+# areas, such that replayed markup never refers to another widget's callbacks
+_click_namespaces = itertools.count()
+
+# the markup for colors and spacings, such that it is only built once
+_color_markup = { }  # (command, color) -> markup
+_space_markup = { }  # number of spaces -> markup
+# the escaped texts for both percent escaping styles. Labels rarely change,
+# so most texts of a frame are found here. The caches are cleared when
+# they grow too large, e.g. for a clock.
+_escaped_text = { False: { }, True: { } }
+_escaped_text_max = 4096
+
+def color_markup(command, color):
+    try:
+        return _color_markup[command, color]
+    except KeyError:
+        markup = '%{' + command + (color if color else '-') + '}'
+        _color_markup[command, color] = markup
+        return markup
+
+def space_markup(count):
+    try:
+        return _space_markup[count]
+    except KeyError:
+        markup = _space_markup[count] = '%{T2}' + (' ' * count) + '%{T-}'
+        return markup
+
+def escape_text(text, old_percent_escapes = False):
+    cache = _escaped_text[old_percent_escapes]
+    try:
+        return cache[text]
+    except KeyError:
+        if len(cache) >= _escaped_text_max:
+            cache.clear()
+        if old_percent_escapes:
+            escaped = cache[text] = text.replace('%', '%%{}')
+        else:
+            escaped = cache[text] = text.replace('%', '%%')
+        return escaped
+
 def textpainter():
-    return Lemonbar.LBPainter(None)
+    painter = Lemonbar.LBPainter(None)
+    # e.g. the clickareas of a ConkyGenerator must not collide with the
+    # names the bar itself uses
+    painter.click_prefix = f'g{next(_click_namespaces)}.'
+    return painter
+
+# a click area (whose command may contain '}'), another markup block, or text
+_markup_tokens = re.compile(r'(%\{A\d*:(?:[^:\\]|\\.)*:\})|%\{([^}]*)\}|(%%|[^%]+|%)')
+# the state lemonbar has at the beginning of every line. None means unknown
+_initial_markup_state = { 'F': '-', 'B': '-', 'U': None, 'T': '-', 'u': '-', 'o': '-' }
+
+def optimize_markup(frame):
+    """
+    Remove redundant state changes from a line of lemonbar markup: colors,
+    fonts and the underline/overline flags are only emitted right before
+    the text that needs them and only if they differ from the state
+    lemonbar already has. This removes changes that are reset without
+    any text in between, and merges adjacent runs of the same font, e.g.
+    of consecutive spaces. lemonbar keeps its state from one line to the
+    next, so the line ends with the changes back to the initial state.
+    """
+    out = [ ]
+    emitted = dict(_initial_markup_state)
+    wanted = dict(_initial_markup_state)
+    def emit_state():
+        for key, value in wanted.items():
+            # None: unknown, so there is nothing to emit
+            if value is not None and value != emitted[key]:
+                emitted[key] = value
+                if key in 'uo':
+                    out.append('%{' + value + key + '}')
+                else:
+                    out.append('%{' + key + value + '}')
+    def command(block):
+        if block[:1] in ('F', 'B', 'U', 'T'):
+            wanted[block[0]] = block[1:]
+        elif block in ('+u', '-u', '+o', '-o'):
+            wanted[block[1]] = block[0]
+        elif block in ('l', 'c', 'r', 'A'):
+            # neither the alignment nor click areas depend on the state
+            out.append('%{' + block + '}')
+        else:
+            # something we don't know the effect of, e.g. %{R}
+            emit_state()
+            out.append('%{' + block + '}')
+            if block == 'R':
+                emitted['F'] = emitted['B'] = wanted['F'] = wanted['B'] = None
+            elif block[:1] == '!':
+                emitted[block[1:]] = wanted[block[1:]] = None
+    for click, block, text in _markup_tokens.findall(frame):
+        if text:
+            emit_state()
+            out.append(text)
+        elif click:
+            out.append(click)
+        elif ' ' in block:
+            # several commands in one block
+            commands = block.split(' ')
+            if any(c[:1] == 'A' for c in commands):
+                # the command of a click area may contain spaces, so
+                # the block is kept as it is and the state is unknown
+                emit_state()
+                out.append('%{' + block + '}')
+                for key in emitted:
+                    emitted[key] = wanted[key] = None
+            else:
+                for c in commands:
+                    if c:
+                        command(c)
+        else:
+            command(block)
+    wanted.update(_initial_markup_state)
+    emit_state()
+    return ''.join(out)
 
 
 class Lemonbar(EventInput):
@@ -19,10 +139,12 @@ class Lemonbar(EventInput):
                  foreground = '#989898',
                  spacing_font=(1, '-*-*-*-*-*-*-2-*-*-*-*-*-*-*'),
                  lemonbar_old_percent_escapes = False,
+                 optimize = False,
                  args = []):
         """
         the spacing_font=(n,font) is a font for which the space character
-        has the width of n pixels
+        has the width of n pixels. If optimize is set, redundant markup is
+        removed from every frame (see optimize_markup())
         """
         # since https://github.com/LemonBoy/bar/commit/1411d260a4c6956ff5a3699ee9bfd5b275209fe3
         # lemonbar handles the escaping of % symbols correctly. If you have an
@@ -52,12 +174,39 @@ class Lemonbar(EventInput):
         super(Lemonbar,self).__init__(command)
         self.widget = None
         self.lemonbar_old_percent_escapes = lemonbar_old_percent_escapes
+        # the click areas of the last frame, replaced by LBPainter.flush()
         self.clickareas = { }
+        self.optimize = optimize
+        self.render_plan = None # see LBPainter.planned_widget()
+        self.last_frame = None
+        self.skipped_frames = 0 # number of frames dropped by write_frame()
+
+    def write_frame(self, frame):
+        # lemonbar parses and redraws the entire bar for every line it
+        # receives, so drop frames that are identical to the previous one.
+        # returns whether the frame was written
+        if frame == self.last_frame:
+            self.skipped_frames += 1
+            if stats.enabled:
+                stats.count('frames skipped')
+            return False
+        self.last_frame = frame
+        if self.optimize:
+            frame = optimize_markup(frame.rstrip('\n')) + '\n'
+        self.write_flushed(frame)
+        if stats.enabled:
+            stats.count('frames written')
+            stats.count('bytes written', len(frame.encode('utf-8')))
+        return True
 
     def handle_line(self,line):
         if line in self.clickareas:
             (callback, b) = self.clickareas[line]
-            callback(b)
+            result = callback(b)
+            if inspect.iscoroutine(result):
+                # e.g. a herbstclient command that we don't want to wait for
+                core.run_coroutine(result)
+            return True
         #elif len(line.split('_')) == 2 and self.widget != None:
         #    # temporary workaround during dransition to painters
         #    line = line.split('_')
@@ -66,56 +215,224 @@ class Lemonbar(EventInput):
         #    self.widget.can_handle_input(name, btn)
         else:
             print("invalid event name: %s" % line)
+            return False
+    class Segment:
+        # the cached output of a widget: literal markup chunks and, for
+        # every subwidget drawn via painter.widget(), a triple
+        # (subwidget, flags before, flags after)
+        def __init__(self, owner, namespace, flags, start):
+            self.owner = owner
+            self.namespace = namespace
+            self.flags_in = flags
+            self.flags_out = flags
+            self.parts = []
+            self.start = start # index of the current chunk's first fragment
+            self.clicks = 0
+            # the click areas in the literal chunks: name -> (callback, button)
+            self.click_entries = { }
+
+    class RenderPlan:
+        """
+        The cached output of a widget tree, flattened into a list of steps:
+        the markup of cacheable containers (e.g. ListLayout, themes) is
+        inlined as string literals, and every other widget becomes a step
+        [widget, flags before, flags after, segment, markup]. Leaves whose
+        cache is plain markup are drawn from the step's markup as long as
+        they stay clean, everything else is drawn via painter.widget().
+        The plan is valid as long as none of the inlined containers
+        changes.
+        """
+        def __init__(self, owner, root, flags_in, flags_out):
+            self.owner = owner
+            self.root = root
+            self.flags_in = flags_in
+            self.flags_out = flags_out
+            self.steps = [ ]
+            self.containers = [ ] # pairs (widget, its segment)
+            self.clicks = { } # the click areas of the inlined literals
+            self.add(root, flags_in, flags_out)
+
+        def add(self, widget, flags_before, flags_after):
+            segment = widget._render_cache
+            if widget.dirty or not widget.cacheable or segment is None \
+                    or segment.owner is not self.owner:
+                self.steps.append([widget, flags_before, flags_after, None, None])
+            elif all(isinstance(part, str) for part in segment.parts):
+                markup = ''.join(segment.parts)
+                self.steps.append([widget, flags_before, flags_after, segment, markup])
+            else:
+                self.containers.append((widget, segment))
+                self.clicks.update(segment.click_entries)
+                for part in segment.parts:
+                    if not isinstance(part, str):
+                        self.add(*part)
+                    elif self.steps and isinstance(self.steps[-1], str):
+                        self.steps[-1] += part
+                    else:
+                        self.steps.append(part)
+
+        def is_valid(self, root, flags):
+            return self.root is root and self.flags_in == flags \
+                and all(not w.dirty and w._render_cache is s for w, s in self.containers)
+
     class LBPainter(TextPainter):
         def __init__(self,lemonbar):
             super(Lemonbar.LBPainter,self).__init__()
-            self.buf = ""
+            # the markup fragments of the frame, joined in flush()
+            self.buf = [ ]
             self.lemonbar = lemonbar
+            self.old_percent_escapes = \
+                lemonbar is not None and lemonbar.lemonbar_old_percent_escapes
+            factor = getattr(lemonbar, 'spacing_font_width', 1)
+            self.spacing_factor = factor if factor else 1
+            # the click areas of this frame: name -> (callback, button)
+            self.clickareas = { }
+            self.click_prefix = ''
             self.next_click_id = 0
+            # the segments being recorded; None while drawing something
+            # that does not belong to the enclosing segment
+            self._segments = [ None ]
+        def widget(self, widget):
+            segment = self._segments[-1]
+            if segment is not None:
+                self._close_chunk(segment)
+                flags = self.flags
+            self._segments.append(None)
+            widget.render_themed(self)
+            self._segments.pop()
+            if segment is not None:
+                segment.parts.append((widget, flags, self.flags))
+                segment.start = len(self.buf)
+        def planned_widget(self, widget):
+            # like widget(), but for the root widget of the lemonbar, whose
+            # render plan is used and rebuilt if necessary
+            plan = self.lemonbar.render_plan
+            if plan is not None and plan.is_valid(widget, self.flags):
+                if self._run_plan(plan):
+                    return
+            flags = self.flags
+            self.widget(widget)
+            self.lemonbar.render_plan = \
+                Lemonbar.RenderPlan(self.lemonbar, widget, flags, self.flags)
+        def _run_plan(self, plan):
+            start = len(self.buf)
+            self.clickareas.update(plan.clicks)
+            for step in plan.steps:
+                if isinstance(step, str):
+                    self.buf.append(step)
+                    continue
+                widget = step[0]
+                if step[4] is not None and not widget.dirty \
+                        and widget._render_cache is step[3]:
+                    self.buf.append(step[4])
+                    self.clickareas.update(step[3].click_entries)
+                    continue
+                self.flags = step[1]
+                self.widget(widget)
+                if self.flags != step[2]:
+                    del self.buf[start:]
+                    self.flags = plan.flags_in
+                    return False
+                # remember the new markup for the next frames
+                segment = widget._render_cache
+                if widget.cacheable and not widget.dirty and segment is not None \
+                        and segment.owner is self.lemonbar \
+                        and all(isinstance(part, str) for part in segment.parts):
+                    step[3], step[4] = segment, ''.join(segment.parts)
+                else:
+                    step[3], step[4] = None, None
+            self.flags = plan.flags_out
+            return True
+        def _close_chunk(self, segment):
+            if len(self.buf) > segment.start:
+                segment.parts.append(''.join(self.buf[segment.start:]))
+        def begin_segment(self, widget):
+            namespace = getattr(widget, '_click_namespace', None)
+            if namespace is None:
+                namespace = widget._click_namespace = next(_click_namespaces)
+            segment = Lemonbar.Segment(self.lemonbar, namespace, self.flags, len(self.buf))
+            self._segments.append(segment)
+            return segment
+        def end_segment(self, segment):
+            self._close_chunk(segment)
+            segment.flags_out = self.flags
+            self._segments.pop()
+            return segment
+        def replay(self, segment):
+            if segment is None or segment.owner is not self.lemonbar \
+                    or segment.flags_in != self.flags:
+                return False
+            start = len(self.buf)
+            self.clickareas.update(segment.click_entries)
+            self._segments.append(None)
+            for part in segment.parts:
+                if isinstance(part, str):
+                    self.buf.append(part)
+                    continue
+                (widget, flags_before, flags_after) = part
+                self.flags = flags_before
+                self.widget(widget)
+                if self.flags != flags_after:
+                    # the subwidget changed the flags differently than
+                    # the cached markup after it expects
+                    del self.buf[start:]
+                    self.flags = segment.flags_in
+                    self._segments.pop()
+                    return False
+            self._segments.pop()
+            self.flags = segment.flags_out
+            return True
         def drawRaw(self, text):
-            self.buf += text
+            self.buf.append(text)
         def text(self, text):
-            if self.lemonbar is None or \
-                not self.lemonbar .lemonbar_old_percent_escapes:
-                self.buf += text.replace('%', '%%')
-            else:
-                self.buf += text.replace('%', '%%{}')
+            self.buf.append(escape_text(text, self.old_percent_escapes))
         def set_ul(self, enabled):
-            self.buf += '%{+u}' if enabled else '%{-u}'
+            self.buf.append('%{+u}' if enabled else '%{-u}')
         def set_ol(self, enabled):
-            self.buf += '%{+o}' if enabled else '%{-o}'
+            self.buf.append('%{+o}' if enabled else '%{-o}')
         def fg(self, color = None):
-            self.buf += '%{F' + color + '}' if color else '%{F-}'
+            self.buf.append(color_markup('F', color))
         def bg(self, color = None):
-            self.buf += '%{B' + color + '}' if color else '%{B-}'
+            self.buf.append(color_markup('B', color))
         def linecolor(self, color = None):
-            self.buf += '%{U' + color + '}' if color else '%{U-}'
+            self.buf.append(color_markup('U', color))
         def ul(self, color = None):
             self.linecolor(color)
         def ol(self, color = None):
             self.linecolor(color)
         def symbol(self, symbol):
-            self.buf += '%{T3}' + chr(symbol) + '%{T-}'
+            self.buf.append('%{T3}' + chr(symbol) + '%{T-}')
         def flush(self):
-            self.lemonbar.write_flushed(self.buf + '\n')
+            self.buf.append('\n')
+            self.lemonbar.write_frame(''.join(self.buf))
+            self.buf.pop()
+            # only the click areas on the screen remain valid
+            self.lemonbar.clickareas = self.clickareas
         def __str__(self):
-            return self.buf
+            return ''.join(self.buf)
         def space(self, width):
-            if hasattr(self.lemonbar, 'spacing_font_width'):
-                factor = self.lemonbar.spacing_font_width
-            else:
-                factor = 1
-            self.buf += '%{T2}' + (' ' * int(width / factor)) + '%{T-}'
+            self.buf.append(space_markup(int(width / self.spacing_factor)))
         def _enter_clickable(self, clickable):
-            click_id = self.next_click_id
-            self.next_click_id += 1
+            segment = self._segments[-1]
+            if segment is not None:
+                click_id = f'{segment.namespace}.{segment.clicks}'
+                segment.clicks += 1
+            else:
+                click_id = f'{self.click_prefix}{self.next_click_id}'
+                self.next_click_id += 1
             for b in clickable.buttons:
                 clickname = f'{click_id}_{b}'
-                self.buf += '%%{A%d:%s:}' % (b, clickname)
-                self.lemonbar.clickareas[clickname] = (clickable.callback, b)
+                self.buf.append('%%{A%d:%s:}' % (b, clickname))
+                self.add_clickareas({ clickname: (clickable.callback, b) })
+        def add_clickareas(self, clickareas):
+            # register click areas (name -> (callback, button)) whose
+            # markup is drawn via drawRaw()
+            self.clickareas.update(clickareas)
+            segment = self._segments[-1]
+            if segment is not None:
+                segment.click_entries.update(clickareas)
         def _exit_clickable(self, clickable):
-            for b in clickable.buttons:
-                self.buf += '%{A}'
+            self.buf.append('%{A}' * len(clickable.buttons))
     def painter(self):
         return Lemonbar.LBPainter(self)
 
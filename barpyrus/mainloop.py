@@ -16,6 +16,7 @@ from barpyrus import hlwm
 from barpyrus.widgets import *
 from barpyrus.conky import ConkyWidget
 from barpyrus import lemonbar
+from barpyrus import stats
 
 def get_config(filepath):
     global_vars = {}
@@ -44,63 +45,119 @@ def main():
     # ---- configuration ---
     conf = get_user_config()
     bar = conf['bar']
-    main_loop(bar)
+    # optional frame rate settings, see main_loop()
+    options = { key: conf[key] for key in ['frame_interval', 'coalesce_delay'] if key in conf }
+    # optional instrumentation, see barpyrus.stats
+    if conf.get('stats'):
+        stats.enable(conf['stats'] if isinstance(conf['stats'], str) else None)
+    if conf.get('engine', 'select') == 'asyncio':
+        from barpyrus import asyncloop
+        asyncloop.main_loop(bar, **options)
+    else:
+        main_loop(bar, **options)
 
-def main_loop(bar, inputs = None):
+def main_loop(bar, inputs = None, frame_interval = 0.016, coalesce_delay = 0.004):
+    """
+    bar is a Lemonbar or a list of Lemonbars (e.g. one per monitor), which
+    are then driven by this single process.
+    frame_interval is the minimal time (in seconds) between two frames.
+    When the bar needs an update, the frame is delayed by coalesce_delay
+    seconds such that a burst of events (e.g. the hooks fired when
+    switching tags) results in only one frame.
+    """
     # TODO: remove eventinputs again?
     #inputs += bar.widget.eventinputs()
     if inputs == None:
         inputs = global_inputs
+    # start the deferred inputs, such that all have a file descriptor
+    core.apply_pending_restarts()
+    if inputs is global_inputs:
+        # all of them are registered when they are started
+        selector = core.global_selector
+    else:
+        selector = core.InputSelector(inputs)
+    bars = bar if isinstance(bar, list) else [ bar ]
 
     global_update = True
+    # time of the first change not drawn yet, i.e. the start for the first frame
+    update_since = time.clock_gettime(time.CLOCK_MONOTONIC)
+    last_frame = -math.inf
     def signal_quit(signal, frame):
         quit_main_loop()
     signal.signal(signal.SIGINT, signal_quit)
     signal.signal(signal.SIGTERM, signal_quit)
+    # widgets that were created but are not part of any bar have no timers
+    core.global_timers.retain(w for b in bars if b.widget for w in b.widget.walk())
 
     # main loop
-    while not core.shutdown_requested() and bar.is_running():
+    while not core.shutdown_requested() and all(b.is_running() for b in bars):
+        restarted, restarts_changed = core.apply_pending_restarts()
+        for x in restarted:
+            selector.update(x)
         now = time.clock_gettime(time.CLOCK_MONOTONIC)
-        if bar.widget.maybe_timeout(now):
+        if restarts_changed and not global_update:
             global_update = True
-        data_ready = []
+            update_since = now
+        if stats.enabled:
+            timers_changed = stats.call('timers', core.global_timers.run_due, now)
+        else:
+            timers_changed = core.global_timers.run_due(now)
+        if timers_changed and not global_update:
+            global_update = True
+            update_since = now
         if global_update:
-            painter = bar.painter()
-            painter.widget(bar.widget)
-            data_ready = select.select(inputs,[],[], 0.00)[0]
-            if not data_ready:
-                #print("REDRAW: " + str(time.clock_gettime(time.CLOCK_MONOTONIC)))
-                painter.flush()
+            frame_due = max(update_since + coalesce_delay, last_frame + frame_interval)
+            if frame_due <= now:
+                #print("REDRAW: " + str(now))
+                for b in bars:
+                    painter = b.painter()
+                    if stats.enabled:
+                        stats.call('frame', painter.planned_widget, b.widget)
+                    else:
+                        painter.planned_widget(b.widget)
+                    painter.flush()
                 global_update = False
-            else:
-                pass
-                #print("more data already ready")
-        if not data_ready:
-            # wait for new data
-            next_timeout = now + 360 # wait for at most one hour until the next bar update
-            to = bar.widget.next_timeout()
-            if to != None:
-                next_timeout = min(next_timeout, to)
-            now = time.clock_gettime(time.CLOCK_MONOTONIC)
-            next_timeout -= now
-            next_timeout = max(next_timeout,0.1)
-            #print("next timeout = " + str(next_timeout))
-            data_ready = select.select(inputs,[],[], next_timeout)[0]
-            if core.shutdown_requested():
-                break
-        if not data_ready:
-            pass #print('timeout!')
-        else:
-            for x in data_ready:
-                try:
-                    x.process()
+                last_frame = now
+                if stats.enabled:
+                    now = time.clock_gettime(time.CLOCK_MONOTONIC)
+                    stats.record('event to frame', now - update_since)
+        # wait for new data
+        next_timeout = now + 360 # wait for at most one hour until the next bar update
+        to = core.global_timers.next_deadline()
+        if to != None:
+            next_timeout = min(next_timeout, to)
+        now = time.clock_gettime(time.CLOCK_MONOTONIC)
+        # a timer that ran is always rescheduled into the future, so there
+        # is no need for a minimal timeout
+        next_timeout = max(next_timeout - now, 0)
+        if global_update:
+            # wake up in time for the pending frame
+            next_timeout = min(next_timeout, max(frame_due - now, 0))
+        #print("next timeout = " + str(next_timeout))
+        data_ready = selector.select(next_timeout)
+        if core.shutdown_requested():
+            break
+        for x in data_ready:
+            try:
+                if stats.enabled:
+                    stats.count('events ' + type(x).__name__)
+                    changed = stats.call('process ' + type(x).__name__, x.process)
+                else:
+                    changed = x.process()
+                if changed and not global_update:
                     global_update = True
-                except EOFError:
-                    print(f"Received EOF from {x}", file=sys.stderr)
-                    quit_main_loop()
-                    break
-    bar.proc.kill()
+                    update_since = time.clock_gettime(time.CLOCK_MONOTONIC)
+            except EOFError:
+                print(f"Received EOF from {x}", file=sys.stderr)
+                selector.unregister(x)
+                quit_main_loop()
+                break
+    for b in bars:
+        b.proc.kill()
     for i in inputs:
         i.kill()
-    bar.proc.wait()
+    for b in bars:
+        b.proc.wait()
+    if stats.enabled:
+        stats.dump()
 
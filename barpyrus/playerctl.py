@@ -4,8 +4,11 @@ from barpyrus.widgets import Widget
 from barpyrus.core import EventInput, Painter
 import barpyrus.colors
 import subprocess
+import asyncio
 
 class PlayerctlFollow(EventInput):
+    # every line contains all variables
+    snapshot = True
     def __init__(self, playerctl_prefix, variables):
         self.variables = variables
         format_str = '<>'.join(['{{markup_escape(' + v + ')}}' for v in variables])
@@ -20,10 +23,13 @@ class PlayerctlFollow(EventInput):
         self.values = {}
 
     def parse_line(self, line):
+        # returns whether the metadata changed
+        old_values = self.values
         if line == '':
             # clear all metadata on empty line
             self.values = { key: '' for key in self.variables }
         else:
+            self.values = dict(self.values)
             fields = line.split('<>')
             if len(fields) != len(self.variables):
                 print("Error: requested {} fields from playerctl but obtained {} fields"
@@ -31,6 +37,7 @@ class PlayerctlFollow(EventInput):
                       file=sys.stderr)
             for key, value in zip(self.variables, fields):
                 self.values[key] = html.unescape(value)
+        return self.values != old_values
 
     def __getitem__(self, key):
         return self.values.get(key, '')
@@ -66,15 +73,22 @@ class Playerctl(Widget):
     def __getitem__(self, key):
         return self.playerctl.values.get(key, '')
 
-    def call(self, *command):
+    def full_command(self, command):
         # always send commands to the player whose status is displayed:
         playerName = self.playerctl['playerName']
         if len(playerName) > 0:
             playerArg = ['--player=' + playerName]
         else:
             playerArg = []
-        full_cmd = self.playerctl_command + playerArg + list(command)
-        subprocess.call(full_cmd)
+        return self.playerctl_command + playerArg + list(command)
+
+    def call(self, *command):
+        subprocess.call(self.full_command(command))
+
+    async def call_async(self, *command):
+        # like call(), but without blocking the asyncio main loop
+        proc = await asyncio.create_subprocess_exec(*self.full_command(command))
+        await proc.wait()
 
     def is_empty(self):
         return self.playerctl['playerName'] == ''
@@ -100,16 +114,16 @@ class Playerctl(Widget):
         title = title[0:30]
         # buttons don't work correctly
         # in the centered area of lemonbar-xft
-        with p.clickable(1, lambda b: self.call('previous')):
+        with p.clickable(1, lambda b: self.call_async('previous')):
             p.fg(barpyrus.colors.PURPLE_DARK)
             p.symbol(0xe096)  # prev icon
         p.fg(barpyrus.colors.PURPLE_DARK)
-        with p.clickable(1, lambda b: self.call('play-pause')):
+        with p.clickable(1, lambda b: self.call_async('play-pause')):
             if self['status'] == 'Playing':
                 p.symbol(0xe059)  # Pause icon
             else:
                 p.symbol(0xe058)  # Play icon
-        with p.clickable(1, lambda b: self.call('next')):
+        with p.clickable(1, lambda b: self.call_async('next')):
             p.symbol(0xe09c)  # next icon
         p += ' '
         p.fg(barpyrus.colors.GRAY_LIGHT)
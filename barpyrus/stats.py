@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+
+import contextlib
+import signal
+import sys
+import time
+
+# Instrumentation of the main loop, the widget rendering and the output to
+# lemonbar. It is off by default, and then every instrumented place only
+# checks the 'enabled' flag. Enable it by setting
+#
+#   stats = True                  # report to stderr
+#   stats = '/tmp/barpyrus.stats' # report to this file
+#
+# in the config. The report is written on SIGUSR1 and on exit, e.g.:
+#
+#   pkill -USR1 -f barpyrus
+
+enabled = False
+output_path = None # None for stderr
+started = None
+counters = { }
+histograms = { }
+
+class Histogram:
+    """
+    durations in power-of-two buckets of microseconds, such that recording
+    is cheap and the memory is bounded
+    """
+    def __init__(self):
+        self.buckets = [ 0 ] * 40
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, duration):
+        self.count += 1
+        self.total += duration
+        if duration > self.max:
+            self.max = duration
+        bucket = int(duration * 1e6).bit_length()
+        self.buckets[min(bucket, len(self.buckets) - 1)] += 1
+
+    def percentile(self, p):
+        # the upper bound of the bucket containing the p-th percentile
+        remaining = self.count * p / 100
+        for bucket, count in enumerate(self.buckets):
+            remaining -= count
+            if remaining <= 0:
+                return min((2 ** bucket) / 1e6, self.max)
+        return self.max
+
+def count(name, amount = 1):
+    counters[name] = counters.get(name, 0) + amount
+
+def record(name, duration):
+    hist = histograms.get(name)
+    if hist is None:
+        hist = histograms[name] = Histogram()
+    hist.add(duration)
+
+def call(name, function, *args):
+    # call the function and record its duration
+    start = time.perf_counter()
+    result = function(*args)
+    record(name, time.perf_counter() - start)
+    return result
+
+# the render time of the subwidgets of the widgets being rendered, such
+# that every widget class is only charged for its own rendering
+_child_time = [ 0.0 ]
+
+@contextlib.contextmanager
+def rendering(widget):
+    start = time.perf_counter()
+    _child_time.append(0.0)
+    try:
+        yield
+    finally:
+        duration = time.perf_counter() - start
+        own = duration - _child_time.pop()
+        _child_time[-1] += duration
+        record('render ' + type(widget).__name__, own)
+
+def report():
+    lines = [ ]
+    uptime = time.monotonic() - started if started is not None else 0.0
+    lines.append('barpyrus statistics after %.1fs' % uptime)
+    for name in sorted(counters):
+        value = counters[name]
+        rate = ' (%.2f/s)' % (value / uptime) if uptime > 0 else ''
+        lines.append('  %-36s %12d%s' % (name, value, rate))
+    lines.append('  %-36s %8s %9s %9s %9s %9s %9s' %
+                 ('durations [ms]', 'count', 'total', 'mean', 'p50', 'p99', 'max'))
+    # the most expensive first
+    for name, hist in sorted(histograms.items(), key=lambda item: -item[1].total):
+        lines.append('  %-36s %8d %9.1f %9.3f %9.3f %9.3f %9.3f' % (
+            name, hist.count, hist.total * 1e3, hist.total / hist.count * 1e3,
+            hist.percentile(50) * 1e3, hist.percentile(99) * 1e3, hist.max * 1e3))
+    return '\n'.join(lines) + '\n'
+
+def dump():
+    if output_path is None:
+        sys.stderr.write(report())
+        sys.stderr.flush()
+    else:
+        with open(output_path, 'w') as f:
+            f.write(report())
+
+def enable(path = None):
+    """
+    start collecting statistics. The report goes to the file at path,
+    or to stderr if path is None.
+    """
+    global enabled, output_path, started
+    enabled = True
+    output_path = path
+    started = time.monotonic()
+    signal.signal(signal.SIGUSR1, lambda signum, frame: dump())
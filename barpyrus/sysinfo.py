@@ -0,0 +1,223 @@
+import os
+import time
+
+from barpyrus.widgets import Widget
+
+# Widgets for system metrics that read /proc and /sys directly, which
+# avoids running a conky process for the common metrics. The files are kept
+# open and re-read with pread(), and the widgets are updated by the widget
+# timers.
+#
+# Every widget computes a dict of values. The 'format' argument is either a
+# format string using these values, e.g. '{cpu:.0f}%', or a function that
+# gets the dict and returns the text. The text may contain lemonbar markup,
+# but in a format string, its braces must be doubled, e.g. '%{{F#efefef}}'.
+
+class ProcFile:
+    """
+    A file in /proc or /sys that stays open and is read from the beginning
+    on every read().
+    """
+    def __init__(self, path):
+        self.path = path
+        self.fd = os.open(path, os.O_RDONLY | os.O_CLOEXEC)
+
+    def read(self):
+        chunks = []
+        offset = 0
+        while True:
+            data = os.pread(self.fd, 65536, offset)
+            if not data:
+                break
+            chunks.append(data)
+            offset += len(data)
+        return b''.join(chunks).decode(errors='replace')
+
+    def close(self):
+        os.close(self.fd)
+
+def open_if_exists(path):
+    try:
+        return ProcFile(path)
+    except OSError:
+        return None
+
+
+class SystemMetric(Widget):
+    cacheable = True
+    def __init__(self, format, interval):
+        super(SystemMetric,self).__init__()
+        self.format = format
+        self.label = ''
+        # metrics don't need to be exact in time, so they may share
+        # wakeups with other timers
+        self.timer_slack = interval / 2
+        self.last_timeout = time.monotonic()
+        self.timer_interval = interval
+
+    def values(self):
+        # returns the dict of values or None if the metric is unavailable
+        return None
+
+    def timeout(self):
+        values = self.values()
+        if values is None:
+            label = ''
+        elif callable(self.format):
+            label = self.format(values)
+        else:
+            label = self.format.format(**values)
+        if_changed = (label != self.label)
+        self.label = label
+        return if_changed
+
+    def render(self, p):
+        p.drawRaw(self.label)
+
+
+class CPU(SystemMetric):
+    """
+    The CPU usage in percent since the last update, with the value 'cpu'
+    """
+    def __init__(self, format = '{cpu:.0f}%', interval = 2):
+        self.stat = ProcFile('/proc/stat')
+        self._last_busy, self._last_total = 0, 0
+        super(CPU,self).__init__(format, interval)
+        self.timeout()
+
+    def values(self):
+        # the first line sums up all cpus:
+        # cpu user nice system idle iowait irq softirq steal ...
+        fields = [ int(v) for v in self.stat.read().split('\n', 1)[0].split()[1:] ]
+        total = sum(fields[:8])
+        busy = total - fields[3] - fields[4]
+        if total == self._last_total:
+            return { 'cpu': 0.0 }
+        cpu = 100 * (busy - self._last_busy) / (total - self._last_total)
+        self._last_busy, self._last_total = busy, total
+        return { 'cpu': cpu }
+
+
+class Memory(SystemMetric):
+    """
+    The memory usage with the values 'memperc' (in percent), 'used' and
+    'total' (in KiB)
+    """
+    def __init__(self, format = '{memperc:.0f}%', interval = 2):
+        self.meminfo = ProcFile('/proc/meminfo')
+        super(Memory,self).__init__(format, interval)
+        self.timeout()
+
+    def values(self):
+        info = {}
+        for line in self.meminfo.read().splitlines():
+            key, _, value = line.partition(':')
+            if key in ('MemTotal', 'MemAvailable'):
+                info[key] = int(value.split()[0])
+        total = info['MemTotal']
+        used = total - info['MemAvailable']
+        return { 'memperc': 100 * used / total, 'used': used, 'total': total }
+
+
+class NetSpeed(SystemMetric):
+    """
+    The network speed of an interface (or of all interfaces except 'lo' if
+    interface is None) in KiB/s, with the values 'down' and 'up'
+    """
+    def __init__(self, interface = None, format = '{down:.1f}K {up:.1f}K', interval = 2):
+        self.interface = interface
+        self.netdev = ProcFile('/proc/net/dev')
+        self._last_bytes = None
+        self._last_update = None
+        super(NetSpeed,self).__init__(format, interval)
+        self.timeout()
+
+    def values(self):
+        down, up = 0, 0
+        # the first two lines are the header, then each line looks like:
+        # iface: rx_bytes rx_packets ... (8 receive fields) tx_bytes ...
+        for line in self.netdev.read().splitlines()[2:]:
+            name, _, counters = line.partition(':')
+            name = name.strip()
+            if name == self.interface or (self.interface is None and name != 'lo'):
+                counters = counters.split()
+                down += int(counters[0])
+                up += int(counters[8])
+        now = time.monotonic()
+        if self._last_bytes is None or now <= self._last_update:
+            speeds = (0.0, 0.0)
+        else:
+            speeds = [ (cur - last) / (now - self._last_update) / 1024
+                       for cur, last in zip((down, up), self._last_bytes) ]
+        self._last_bytes, self._last_update = (down, up), now
+        return dict(zip(('down', 'up'), speeds))
+
+
+class Battery(SystemMetric):
+    """
+    The state of a battery with the values 'percent' and 'status' (e.g.
+    'Charging', 'Discharging', 'Full'). The widget is empty if there is no
+    such battery.
+    """
+    def __init__(self, name = 'BAT0', format = '{percent}%', interval = 10):
+        path = os.path.join('/sys/class/power_supply', name)
+        self.capacity = open_if_exists(os.path.join(path, 'capacity'))
+        self.status = open_if_exists(os.path.join(path, 'status'))
+        super(Battery,self).__init__(format, interval)
+        self.timeout()
+
+    def values(self):
+        if self.capacity is None:
+            return None
+        try:
+            percent = int(self.capacity.read())
+            status = self.status.read().strip() if self.status else 'Unknown'
+        except (OSError, ValueError):
+            # e.g. while the battery is being removed
+            return None
+        return { 'percent': percent, 'status': status }
+
+
+class FilesystemUsage(SystemMetric):
+    """
+    The usage of the file system mounted at path, with the values
+    'used_perc' (in percent, like df), 'used', 'free' and 'size' (in bytes)
+    """
+    def __init__(self, path = '/', format = '{used_perc:.0f}%', interval = 30):
+        self.path = path
+        super(FilesystemUsage,self).__init__(format, interval)
+        self.timeout()
+
+    def values(self):
+        st = os.statvfs(self.path)
+        used = (st.f_blocks - st.f_bfree) * st.f_frsize
+        free = st.f_bavail * st.f_frsize
+        size = st.f_blocks * st.f_frsize
+        used_perc = 100 * used / (used + free) if used + free else 0.0
+        return { 'used_perc': used_perc, 'used': used, 'free': free, 'size': size }
+
+
+class Uptime(SystemMetric):
+    """
+    The time since boot, with the values 'uptime' (in seconds) and 'days',
+    'hours', 'minutes' for the respective parts
+    """
+    def __init__(self, format = '{days}d {hours}h {minutes}m', interval = 60):
+        self.proc_uptime = ProcFile('/proc/uptime')
+        super(Uptime,self).__init__(format, interval)
+        self.timeout()
+
+    def values(self):
+        uptime = float(self.proc_uptime.read().split()[0])
+        minutes = int(uptime) // 60
+        return { 'uptime': uptime, 'days': minutes // (24 * 60),
+                 'hours': minutes // 60 % 24, 'minutes': minutes % 60 }
+
+
+def format_bytes(size):
+    # e.g. format_bytes(3 * 1024**3) == '3.0GiB'
+    for unit in ['B', 'KiB', 'MiB', 'GiB', 'TiB']:
+        if size < 1024 or unit == 'TiB':
+            break
+        size /= 1024
+    return ('%d%s' if unit == 'B' else '%.1f%s') % (size, unit)
@@ -1,7 +1,7 @@
 #!/usr/bin/env python3
 
 from barpyrus.widgets import Widget
-from barpyrus.core import EventInput
+from barpyrus.core import EventInput, global_selector
 from Xlib.display import Display, X
 import Xlib
 import sys
@@ -80,12 +80,16 @@ class WindowWatch(EventInput):
         return None
 
     def watch_trayer_non_blocking(self):
+        # returns whether the watched window has been reconfigured
+        configured = False
         while self.display.pending_events() > 0:
             event = self.display.next_event()
             if event.type != X.ConfigureNotify:
                 continue
             if event.window != self.trayer:
                 continue
+            configured = True
+        return configured
 
     def get_width(self):
         try:
@@ -97,6 +101,7 @@ class WindowWatch(EventInput):
         return self.width
 
     def kill(self):
+        global_selector.unregister(self)
         self.proc.kill()
         self.display.close()
 
@@ -104,7 +109,7 @@ class WindowWatch(EventInput):
         return self.display.fileno()
 
     def process(self):
-        self.watch_trayer_non_blocking()
+        return self.watch_trayer_non_blocking()
 
 
 class TrayerWidget(Widget):
@@ -7,12 +7,31 @@ import sys
 import select
 import os
 import math
+import re
 import struct
 
 from barpyrus import core
 from barpyrus import core
+from barpyrus import stats
+
+_unset = object()
 
 class Widget:
+    # A cacheable widget's output only depends on its public attributes and
+    # on the subwidgets it draws via painter.widget(). Assigning a changed
+    # value to a public attribute marks the widget dirty; clean widgets
+    # replay their cached output instead of being rendered again. The cache
+    # belongs to the bar that has drawn the widget last, so a widget must
+    # not be shared by several bars. A subclass that overrides render() may
+    # read any other state, so it is only cacheable if it sets
+    # cacheable = True itself.
+    cacheable = False
+    # attributes that don't influence the rendered output
+    untracked_attributes = { 'dirty', 'timer_interval', 'timer_slack', 'last_timeout' }
+    # how many seconds a timeout may be delayed in order to share the
+    # wakeup with other timers
+    timer_slack = 0
+
     def __init__(self):
         self.timer_interval = None
         self.buttons = [ ]
@@ -23,9 +42,56 @@ class Widget:
         self.subwidgets = []
         self.theme = None
         self.custom_render = None # here the user can override a widgets render()
+        self.dirty = True
+        self._render_cache = None
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        if 'render' in cls.__dict__ and 'cacheable' not in cls.__dict__:
+            cls.cacheable = False
+
+    def __setattr__(self, name, value):
+        if name[0] == '_' or name in self.untracked_attributes:
+            object.__setattr__(self, name, value)
+            if name == 'timer_interval' or (name == 'timer_slack'
+                                            and 'timer_interval' in self.__dict__):
+                self.schedule_timer()
+            return
+        old = self.__dict__.get(name, _unset)
+        object.__setattr__(self, name, value)
+        if value is not None and (name in ('pre_render', 'post_render', 'custom_render')
+                or (name == 'theme' and (value.begin_cb or value.end_cb))):
+            # callbacks may draw arbitrary state, so don't cache their output.
+            # set cacheable = True afterwards if that's known to be safe.
+            object.__setattr__(self, 'cacheable', False)
+        if old is _unset or (old is not value and old != value):
+            self.dirty = True
+
+    def mark_dirty(self):
+        # for state changes that are not attribute assignments
+        self.dirty = True
+
     def timeout(self):
         # called on timeout. Return true if an update is needed
         return False
+    def schedule_timer(self):
+        if self.timer_interval:
+            last_timeout = getattr(self, 'last_timeout', 0.0)
+            core.global_timers.schedule(self, last_timeout + self.timer_interval,
+                                        self.timer_slack)
+        else:
+            core.global_timers.cancel(self)
+    def handle_timeout(self, now):
+        # called by the timer queue once the timer is due
+        self.last_timeout = now
+        if_changed = self.timeout()
+        self.schedule_timer()
+        return if_changed
+    def walk(self):
+        # yields this widget and all widgets it may draw
+        yield self
+        for w in self.subwidgets:
+            yield from w.walk()
     def eventinputs(self): # returns a list of Core.EventInput objects
         inputs = []
         for w in self.subwidgets:
@@ -72,6 +138,16 @@ class Widget:
         return False
 
     def render_themed(self,painter):
+        if stats.enabled:
+            with stats.rendering(self):
+                self._render_themed(painter)
+        else:
+            self._render_themed(painter)
+
+    def _render_themed(self,painter):
+        if not self.dirty and painter.replay(self._render_cache):
+            return
+        segment = painter.begin_segment(self) if self.cacheable else None
         clickable = None
         if self.buttons:
             clickable = core.Painter.Clickable(self.buttons, self, self.on_click)
@@ -90,6 +166,9 @@ class Widget:
             self.theme.end_with_attributes(painter, self)
         if self.buttons:
             painter._exit_clickable(clickable)
+        if segment is not None:
+            self._render_cache = painter.end_segment(segment)
+            self.dirty = False
 
     def print_widget_tree(self, indent='', file=sys.stderr):
         print('{}- Widget "{}" has {} subwidgets'
@@ -100,6 +179,7 @@ class Widget:
 
 
 class RawLabel(Widget):
+    cacheable = True
     def __init__(self,label):
         super(RawLabel,self).__init__()
         self.label = label
@@ -107,6 +187,7 @@ class RawLabel(Widget):
         p.drawRaw(self.label)
 
 class Label(Widget):
+    cacheable = True
     def __init__(self,label):
         super(Label,self).__init__()
         self.label = label
@@ -115,6 +196,7 @@ class Label(Widget):
 
 
 class ColorLabel(RawLabel):
+    cacheable = True
     def __init__(self, label, color):
         super().__init__(label=label)
         self.color = color
@@ -123,11 +205,24 @@ class ColorLabel(RawLabel):
         super().render(p)
 
 class Button(Widget):
+    _cacheable = True
     def __init__(self, label):
         super(Button,self).__init__()
         self.label = label
         self.buttons = [ 1 ]
         self.callback = None
+    @property
+    def cacheable(self):
+        # a widget label is rendered directly, so its changes aren't
+        # tracked. The label may be replaced at any time.
+        return self._cacheable and not isinstance(getattr(self, 'label', None), Widget)
+    @cacheable.setter
+    def cacheable(self, value):
+        self._cacheable = value
+    def walk(self):
+        yield from super(Button,self).walk()
+        if isinstance(self.label, Widget):
+            yield from self.label.walk()
     def render(self, p):
         if isinstance(self.label, Widget):
             self.label.render(p)
@@ -135,8 +230,20 @@ class Button(Widget):
             p += self.label
     def on_click(self, button):
         if self.callback:
-            self.callback(button)
+            return self.callback(button)
+
 
+def time_format_granularity(time_format):
+    """
+    returns the smallest unit of time (in seconds) that is shown by the
+    given strftime() format.
+    """
+    for directive in re.findall(r'%[-_0^#]*[EO]?(.)', time_format):
+        if directive in 'sSTXcrf+':
+            return 1
+    # Hours and days also only change at minute boundaries, even on time
+    # zone and daylight saving changes, so there is no need to go further.
+    return 60
 
 class DateTime(Label):
     """
@@ -147,8 +254,9 @@ class DateTime(Label):
     """
     def __init__(self, time_format = '%H:%M, %Y-%m-%d', timezone=None):
         super(DateTime,self).__init__('')
-        self.timer_interval = 1
         self.time_format = time_format
+        # only wake up when the displayed time changes
+        self.timer_interval = time_format_granularity(time_format)
         self.last_time = ''
         self.tz_name = timezone
         self.tz = None
@@ -169,6 +277,16 @@ class DateTime(Label):
         self.last_time = self.label
         return if_changed
 
+    def schedule_timer(self):
+        # wake up right at the next second resp. minute on the wall clock,
+        # the deadline itself is on the monotonic clock like all timers
+        if self.timer_interval:
+            delay = self.timer_interval - time.time() % self.timer_interval
+            core.global_timers.schedule(self, time.monotonic() + delay,
+                                        self.timer_slack)
+        else:
+            core.global_timers.cancel(self)
+
 
 class ExButton(Button):
     def __init__(self, label, cmd):
@@ -181,6 +299,7 @@ class ExButton(Button):
 
 
 class Switcher(Widget):
+    cacheable = True
     def __init__(self,choices,selection=0):
         super(Switcher,self).__init__()
         self.option_buttons = [ Button(x) for x in choices ]
@@ -263,6 +382,10 @@ class TabbedLayout(StackedLayout):
             return True
         return super(TabbedLayout,self).can_handle_input(click_id, btn)
 
+    def walk(self):
+        yield from super(TabbedLayout,self).walk()
+        yield from self.tab_label.walk()
+
     def render(self,painter):
         painter.widget(self.tab_label)
         super(TabbedLayout,self).render(painter)
@@ -279,6 +402,7 @@ class ShortLongLayout(TabbedLayout):
         super(ShortLongLayout,self).__init__(tabs, selection = (1 if longdefault else 0))
 
 class ListLayout(Widget):
+    cacheable = True
     def __init__(self, widgets):
         # just show a couple of widgets side by side
         super(ListLayout,self).__init__()
@@ -0,0 +1,26 @@
+from barpyrus import lemonbar
+from barpyrus.conky import ConkyGenerator
+
+# generating conky source text with a ConkyGenerator
+
+def battery_text():
+    cg = ConkyGenerator(lemonbar.textpainter())
+    with cg.if_('existing /sys/class/power_supply/BAT0'):
+        cg.fg('#9fbc00')
+        with cg.clickable(1, lambda button: None):
+            with cg.cases():
+                for percent in range(10, 100, 10):
+                    cg.case(cg.match('battery_percent') < percent)
+                    cg.symbol(0xe242 + percent // 10)
+                cg.else_()
+                cg.symbol(0xe24b)
+        cg += ' '
+        cg.var('battery_percent')
+        cg += '%'
+        cg.fg()
+    return cg.conky_source_text()
+
+def benchmarks():
+    return {
+        'ConkyGenerator battery text': battery_text,
+    }
@@ -0,0 +1,22 @@
+from common import NullLemonbar
+from barpyrus import hlwm
+
+# parsing and drawing the tag status of 100 tags
+
+def benchmarks():
+    status = [ '#1', '+2', ':3', '!4', '-5', '%6', '.7', '.8' ] * 12 + [ '.9' ] * 4
+    tags = [ hlwm.HLWMTagInfo() for _ in status ]
+    bar = NullLemonbar()
+    def parse():
+        for i, (tag, tag_status) in enumerate(zip(tags, status)):
+            tag.parse(tag_status, i)
+    def underlined_tags():
+        p = bar.painter()
+        for tag in tags:
+            hlwm.underlined_tags(tag, p)
+        return str(p)
+    parse()
+    return {
+        'HLWMTagInfo.parse, 100 tags': parse,
+        'underlined_tags, 100 tags': underlined_tags,
+    }
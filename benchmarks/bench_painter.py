@@ -0,0 +1,42 @@
+from common import NullLemonbar
+from barpyrus import lemonbar
+from barpyrus.core import Painter
+
+# the LBPainter primitives, 100 calls per operation
+
+def benchmarks():
+    bar = NullLemonbar()
+    def text():
+        p = bar.painter()
+        for i in range(100):
+            p += 'some text with 50% load'
+        return str(p)
+    def colors():
+        p = bar.painter()
+        for i in range(50):
+            p.fg('#efefef')
+            p.bg('#303030')
+        return str(p)
+    def space():
+        p = bar.painter()
+        for i in range(100):
+            p.space(3)
+        return str(p)
+    def clickables():
+        p = bar.painter()
+        for i in range(100):
+            clickable = Painter.Clickable([1, 3], None, lambda button: None)
+            p._enter_clickable(clickable)
+            p += 'x'
+            p._exit_clickable(clickable)
+        return str(p)
+    frame = clickables() + colors() + space()
+    def optimize():
+        return lemonbar.optimize_markup(frame)
+    return {
+        'painter text x100': text,
+        'painter fg/bg x100': colors,
+        'painter space x100': space,
+        'painter clickable x100': clickables,
+        'optimize_markup': optimize,
+    }
@@ -0,0 +1,47 @@
+import time
+
+from common import NullLemonbar, UncachedPainter, widget_tree
+from barpyrus import core
+from barpyrus import widgets as W
+
+# rendering synthetic widget trees, and the widget timers
+
+class Periodic(W.Widget):
+    def __init__(self, interval):
+        super(Periodic,self).__init__()
+        self.last_timeout = time.monotonic()
+        self.timer_interval = interval
+
+def benchmarks():
+    benchmarks = { }
+    for depth, width in [ (1, 100), (2, 10), (4, 4) ]:
+        name = 'tree depth %d width %d' % (depth, width)
+        tree = widget_tree(depth, width)
+        bar = NullLemonbar()
+        def uncached(tree=tree, bar=bar):
+            p = UncachedPainter(bar)
+            p.widget(tree)
+            p.flush()
+        def cached(tree=tree, bar=bar):
+            p = bar.painter()
+            p.widget(tree)
+            p.flush()
+        def planned(tree=tree, bar=bar):
+            p = bar.painter()
+            p.planned_widget(tree)
+            p.flush()
+        benchmarks['render_themed uncached, ' + name] = uncached
+        benchmarks['render_themed cached, ' + name] = cached
+        benchmarks['render plan, ' + name] = planned
+    # 1000 widgets with timers, of which none is due
+    timers = core.TimerQueue()
+    saved_timers, core.global_timers = core.global_timers, timers
+    leaves = [ Periodic(1000 + i) for i in range(1000) ]
+    core.global_timers = saved_timers
+    tree = W.ListLayout([ W.ListLayout(leaves[i:i+10]) for i in range(0, 1000, 10) ])
+    now = time.monotonic()
+    benchmarks['next_timeout, 1000 timers'] = lambda: tree.next_timeout()
+    benchmarks['maybe_timeout, 1000 timers'] = lambda: tree.maybe_timeout(now)
+    benchmarks['TimerQueue.next_deadline, 1000 timers'] = lambda: timers.next_deadline()
+    benchmarks['TimerQueue.run_due, 1000 timers'] = lambda: timers.run_due(now)
+    return benchmarks
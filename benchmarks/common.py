@@ -0,0 +1,80 @@
+import os
+import sys
+import time
+import tracemalloc
+
+# run against the barpyrus of this checkout
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from barpyrus import lemonbar
+from barpyrus import widgets as W
+from barpyrus.core import Theme
+
+class NullLemonbar(lemonbar.Lemonbar):
+    """
+    A Lemonbar without a lemonbar process, which only counts what it
+    would write
+    """
+    def __init__(self, optimize = False):
+        # no EventInput.__init__(), so no process is started
+        self.widget = None
+        self.lemonbar_old_percent_escapes = False
+        self.spacing_font_width = 1
+        self.clickareas = { }
+        self.optimize = optimize
+        self.render_plan = None
+        self.last_frame = None
+        self.skipped_frames = 0
+        self.bytes_written = 0
+
+    def write_flushed(self, text):
+        self.bytes_written += len(text)
+
+class UncachedPainter(lemonbar.Lemonbar.LBPainter):
+    # renders every widget without the render cache
+    def begin_segment(self, widget):
+        return None
+    def replay(self, segment):
+        return False
+
+def widget_tree(depth, width):
+    """
+    a tree of ListLayouts of the given depth, where every layout has
+    'width' children, and the leaves are themed labels and buttons
+    """
+    theme = Theme(bg = '#303030', fg = '#efefef', padding = (3,3))
+    def build(level, path):
+        if level == depth:
+            if len(path) % 2:
+                return W.Button('button %s' % path)
+            return theme(W.Label('label %s' % path))
+        return W.ListLayout([ build(level + 1, path + str(i)) for i in range(width) ])
+    return build(0, '')
+
+def measure(function, min_time = 0.2, repeat = 3):
+    """
+    returns (operations per second, peak allocation of one operation in
+    bytes). The number of operations is chosen such that one run takes
+    at least min_time seconds, and the best of 'repeat' runs counts.
+    """
+    count = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(count):
+            function()
+        duration = time.perf_counter() - start
+        if duration >= min_time:
+            break
+        count *= 2 if duration < min_time / 10 else 1 + int(min_time / max(duration, 1e-9))
+    best = duration
+    for _ in range(repeat - 1):
+        start = time.perf_counter()
+        for _ in range(count):
+            function()
+        best = min(best, time.perf_counter() - start)
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    function()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return (count / best, peak)
@@ -0,0 +1,33 @@
+from barpyrus import hlwm
+from barpyrus import widgets as W
+from barpyrus.core import Theme
+from barpyrus import lemonbar
+from barpyrus import conky
+from barpyrus import sysinfo
+import os
+
+# The config run by benchmarks/e2e/run.py. It looks like share/config.py,
+# but the panel is fed by the stub executables in benchmarks/e2e/stubs/.
+
+hc = hlwm.connect()
+
+monitor = 0
+(x, y, monitor_w, monitor_h) = hc.monitor_rect(monitor)
+height = 16
+hc(['pad', str(monitor), str(height)])
+
+grey_frame = Theme(bg = '#303030', fg = '#EFEFEF', padding = (3,3))
+
+bar = lemonbar.Lemonbar(geometry = (x,y,monitor_w,height))
+bar.widget = W.ListLayout([
+    W.RawLabel('%{l}'),
+    hlwm.HLWMTags(hc, monitor),
+    W.RawLabel('%{c}'),
+    grey_frame(hlwm.HLWMWindowTitle(hc)),
+    W.RawLabel('%{r}'),
+    conky.ConkyWidget('cpu ${cpu}% mem ${memperc}% '),
+    sysinfo.CPU('{cpu:.0f}% '),
+    grey_frame(W.DateTime('%d. %B, %H:%M:%S')),
+])
+
+engine = os.environ.get('E2E_ENGINE', 'select')
@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+"""
+End-to-end benchmark of barpyrus. A config is run by the real main loop,
+but herbstclient, lemonbar and conky are replaced by the stub executables
+in benchmarks/e2e/stubs/, so neither X nor herbstluftwm is needed:
+
+    python3 benchmarks/e2e/run.py [--duration SEC] [--hook-rate N] ...
+
+The stub herbstclient emits window title hooks at a fixed rate and logs
+when it emitted which title; the stub lemonbar logs every frame it
+receives. From these logs, the harness reports the frames written, the
+CPU time used, the latency from a hook to the first frame showing it, and
+the redundant frames, i.e. those identical to their predecessor.
+
+The CPU time of barpyrus itself is reported separately from that of the
+stubs it ran and waited for. Every one-shot herbstclient call, e.g. the
+tag_status query after a tag_changed hook, starts a Python interpreter,
+which blocks barpyrus much longer than the real herbstclient. Use
+--tag-every 0 to measure the latency without such calls.
+"""
+
+import argparse
+import json
+import os
+import re
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+
+here = os.path.dirname(os.path.abspath(__file__))
+root = os.path.dirname(os.path.dirname(here))
+
+def percentile(values, p):
+    if not values:
+        return float('nan')
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+def process_cpu_time(pid):
+    # the user and system time of a process, without that of its children
+    with open('/proc/%d/stat' % pid) as f:
+        # the fields after the command name, which may contain spaces
+        fields = f.read().rsplit(')', 1)[1].split()
+    return (int(fields[11]) + int(fields[12])) / os.sysconf('SC_CLK_TCK')
+
+def run_bar(args, log_dir):
+    # returns the cpu time of barpyrus and that of the children it waited for
+    env = dict(os.environ)
+    env['PATH'] = os.path.join(here, 'stubs') + os.pathsep + env.get('PATH', '')
+    env['PYTHONPATH'] = root + os.pathsep + env.get('PYTHONPATH', '')
+    env['BARPYRUS_CONFIG'] = os.path.abspath(args.config)
+    env['E2E_LOG_DIR'] = log_dir
+    env['E2E_HOOK_RATE'] = str(args.hook_rate)
+    env['E2E_TAG_EVERY'] = str(args.tag_every)
+    env['E2E_CONKY_RATE'] = str(args.conky_rate)
+    env['E2E_ENGINE'] = args.engine
+    env['E2E_EPOCH'] = str(time.monotonic())
+    # in a session of its own, such that the stubs can be killed with it
+    proc = subprocess.Popen([ sys.executable, os.path.join(root, 'barpyrus.py') ],
+                            env=env, start_new_session=True)
+    try:
+        time.sleep(args.duration)
+        # before the shutdown, which isn't measured
+        own_cpu_time = process_cpu_time(proc.pid)
+        try:
+            os.kill(proc.pid, signal.SIGTERM)
+        except ProcessLookupError:
+            pass
+        # the rusage covers barpyrus and the children it has waited for. A
+        # barpyrus that exited early, e.g. on a config error, is reaped here.
+        # Until then, its /proc entry is still there.
+        _, status, rusage = os.wait4(proc.pid, 0)
+        proc.returncode = os.waitstatus_to_exitcode(status)
+    finally:
+        try:
+            os.killpg(proc.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+    if proc.returncode not in (0, -signal.SIGTERM):
+        print('barpyrus exited with status %d' % proc.returncode, file=sys.stderr)
+    return own_cpu_time, rusage.ru_utime + rusage.ru_stime - own_cpu_time
+
+def read_log(path, parse):
+    if not os.path.exists(path):
+        return [ ]
+    with open(path) as f:
+        return [ parse(line.rstrip('\n')) for line in f ]
+
+def analyze(log_dir, cpu_time, duration):
+    hooks = read_log(os.path.join(log_dir, 'hooks.log'),
+                     lambda l: (int(l.split()[0]), float(l.split()[1])))
+    # while barpyrus replaces its idle process, a hook may be emitted twice
+    first_emit = { }
+    for seq, emitted in hooks:
+        first_emit[seq] = min(emitted, first_emit.get(seq, emitted))
+    hooks = sorted(first_emit.items())
+    frames = read_log(os.path.join(log_dir, 'lemonbar.log'),
+                      lambda l: (float(l.split('\t', 1)[0]), l.split('\t', 1)[1]))
+    # the latency is measured once barpyrus is up, i.e. after its first frame
+    if frames:
+        hooks = [ (seq, emitted) for seq, emitted in hooks if emitted >= frames[0][0] ]
+    redundant = sum(1 for a, b in zip(frames, frames[1:]) if a[1] == b[1])
+    # a hook is shown by the first frame that shows its title or a newer one
+    latencies = [ ]
+    shown = -1
+    frame_iter = iter(frames)
+    for seq, emitted in hooks:
+        while shown < seq:
+            frame = next(frame_iter, None)
+            if frame is None:
+                break
+            m = re.search(r'e2e-(\d+)', frame[1])
+            if m:
+                shown = max(shown, int(m.group(1)))
+                shown_at = frame[0]
+        if shown < seq:
+            break
+        latencies.append(max(0.0, shown_at - emitted))
+    latencies.sort()
+    return {
+        'duration': duration,
+        'hooks': len(hooks),
+        'hooks_shown': len(latencies),
+        'frames': len(frames),
+        'redundant_frames': redundant,
+        'cpu_time': cpu_time,
+        'latency_p50_ms': percentile(latencies, 50) * 1000,
+        'latency_p90_ms': percentile(latencies, 90) * 1000,
+        'latency_p99_ms': percentile(latencies, 99) * 1000,
+        'latency_max_ms': (latencies[-1] if latencies else float('nan')) * 1000,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description='barpyrus end-to-end benchmark')
+    parser.add_argument('--config', default=os.path.join(here, 'config.py'),
+                        help='the barpyrus config to run')
+    parser.add_argument('--duration', type=float, default=5, help='seconds to run')
+    parser.add_argument('--hook-rate', type=float, default=100,
+                        help='herbstluftwm hooks per second')
+    parser.add_argument('--tag-every', type=int, default=10,
+                        help='make every n-th hook a tag_changed hook (0 for none)')
+    parser.add_argument('--conky-rate', type=float, default=1,
+                        help='conky updates per second')
+    parser.add_argument('--engine', default='select', choices=['select', 'asyncio'])
+    parser.add_argument('--save', metavar='FILE', help='save the results as JSON')
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory(prefix='barpyrus-e2e-') as log_dir:
+        cpu_time, children_cpu_time = run_bar(args, log_dir)
+        results = analyze(log_dir, cpu_time, args.duration)
+        results['children_cpu_time'] = children_cpu_time
+    print('hooks emitted:        %d (%d shown)' % (results['hooks'], results['hooks_shown']))
+    print('frames written:       %d (%.1f/s)' % (results['frames'], results['frames'] / args.duration))
+    print('redundant frames:     %d' % results['redundant_frames'])
+    print('cpu time of barpyrus: %.3fs (%.1f%%)' % (cpu_time, 100 * cpu_time / args.duration))
+    print('cpu time of stubs:    %.3fs (%.1f%%)' % (children_cpu_time,
+                                                  100 * children_cpu_time / args.duration))
+    print('hook->frame latency:  p50 %.2fms  p90 %.2fms  p99 %.2fms  max %.2fms' % (
+          results['latency_p50_ms'], results['latency_p90_ms'],
+          results['latency_p99_ms'], results['latency_max_ms']))
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+"""
+Microbenchmarks for the hot paths of barpyrus. They need neither X, nor
+herbstluftwm, nor lemonbar. Run them with
+
+    python3 benchmarks/run.py [--save FILE] [--compare FILE] [PATTERN ...]
+
+Only the benchmarks whose name contains one of the patterns run. With
+--save, the results are stored as JSON, and with --compare, the results
+are compared to such a file, e.g. to the results before a change.
+
+For the whole panel, including its subprocesses, see benchmarks/e2e/run.py.
+"""
+
+import argparse
+import json
+
+import common
+import bench_painter
+import bench_widgets
+import bench_hlwm
+import bench_conky
+
+suites = [ bench_painter, bench_widgets, bench_hlwm, bench_conky ]
+
+def main():
+    parser = argparse.ArgumentParser(description='barpyrus microbenchmarks')
+    parser.add_argument('patterns', nargs='*', help='only run matching benchmarks')
+    parser.add_argument('--save', metavar='FILE', help='save the results as JSON')
+    parser.add_argument('--compare', metavar='FILE', help='compare to saved results')
+    parser.add_argument('--min-time', type=float, default=0.2,
+                        help='minimal duration of a measurement in seconds')
+    args = parser.parse_args()
+    baseline = { }
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    results = { }
+    print('%-48s %12s %12s %10s' % ('benchmark', 'ops/sec', 'peak alloc', 'vs. base'))
+    for suite in suites:
+        for name, function in suite.benchmarks().items():
+            if args.patterns and not any(p in name for p in args.patterns):
+                continue
+            ops, peak = common.measure(function, min_time=args.min_time)
+            results[name] = { 'ops': ops, 'peak_alloc': peak }
+            if name in baseline:
+                ratio = '%9.2fx' % (ops / baseline[name]['ops'])
+            else:
+                ratio = ''
+            print('%-48s %12.0f %11.1fK %10s' % (name, ops, peak / 1024, ratio), flush=True)
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+
+if __name__ == '__main__':
+    main()
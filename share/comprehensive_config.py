@@ -2,7 +2,7 @@ from barpyrus import hlwm
 from barpyrus import widgets as W
 from barpyrus.core import Theme
 from barpyrus import lemonbar
-from barpyrus import conky
+from barpyrus import sysinfo
 import sys
 # Copy this config to ~/.config/barpyrus/config.py
 
@@ -17,7 +17,7 @@ height = 16 # height of the panel
 width = monitor_w # width of the panel
 hc(['pad', str(monitor), str(height)]) # get space for the panel
 
-# An example conky-section:
+# An example section with system metrics:
 # icons
 bat_icons = [
     0xe242, 0xe243, 0xe244, 0xe245, 0xe246,
@@ -26,27 +26,20 @@ bat_icons = [
 # first icon: 0 percent
 # last icon: 100 percent
 bat_delta = 100 / len(bat_icons)
-conky_text = '%{F\\#9fbc00}%{T2}\ue026%{T-}%{F\\#989898}${cpu}% '
-conky_text += '%{F\\#9fbc00}%{T2}\ue021%{T-}%{F\\#989898}${memperc}% '
-conky_text += '%{F\\#9fbc00}%{T2}\ue13c%{T-}%{F\\#989898}${downspeedf}K '
-conky_text += '%{F\\#9fbc00}%{T2}\ue13b%{T-}%{F\\#989898}${upspeedf}K '
-conky_text += "${if_existing /sys/class/power_supply/BAT0}"
-conky_text += "%{T2}"
-conky_text += "${if_match \"$battery\" == \"discharging $battery_percent%\"}"
-conky_text += "%{F\\#FFC726}"
-conky_text += "$else"
-conky_text += "%{F\\#9fbc00}"
-conky_text += "$endif"
-for i,icon in enumerate(bat_icons[:-1]):
-    conky_text += "${if_match $battery_percent < %d}" % ((i+1)*bat_delta)
-    conky_text += chr(icon)
-    conky_text += "${else}"
-conky_text += chr(bat_icons[-1]) # icon for 100 percent
-for _ in bat_icons[:-1]:
-    conky_text += "${endif}"
-conky_text += "%{T-} $battery_percent% "
-conky_text += "${endif}"
-conky_text += "%{F-}"
+def battery_text(bat):
+    color = '#FFC726' if bat['status'] == 'Discharging' else '#9fbc00'
+    icon = bat_icons[min(int(bat['percent'] / bat_delta), len(bat_icons) - 1)]
+    return '%{F' + color + '}%{T2}' + chr(icon) + '%{T-} ' + str(bat['percent']) + '% '
+def icon(symbol):
+    return W.RawLabel('%{F#9fbc00}%{T2}' + symbol + '%{T-}%{F#989898}')
+system_metrics = W.ListLayout([
+    icon('\ue026'), sysinfo.CPU('{cpu:.0f}% '),
+    icon('\ue021'), sysinfo.Memory('{memperc:.0f}% '),
+    icon('\ue13c'), sysinfo.NetSpeed(format = '{down:.1f}K '),
+    icon('\ue13b'), sysinfo.NetSpeed(format = '{up:.1f}K '),
+    sysinfo.Battery('BAT0', battery_text),
+    W.RawLabel('%{F-}'),
+])
 
 # example options for the hlwm.HLWMLayoutSwitcher widget
 xkblayouts = [
@@ -69,10 +62,10 @@ bar.widget = W.ListLayout([
            # this widget is shown on the focused monitor:
            grey_frame(hlwm.HLWMWindowTitle(hc)),
            # this widget is shown on all unfocused monitors:
-           conky.ConkyWidget('df /: ${fs_used_perc /}%')
+           sysinfo.FilesystemUsage('/', 'df /: {used_perc:.0f}%')
                                     ),
     W.RawLabel('%{r}'),
-    conky.ConkyWidget(text= conky_text),
+    system_metrics,
     # something like a tabbed widget with the tab labels '>' and '<'
     W.ShortLongLayout(
         W.RawLabel(''),
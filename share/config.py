@@ -2,13 +2,15 @@ from barpyrus import hlwm
 from barpyrus import widgets as W
 from barpyrus.core import Theme
 from barpyrus import lemonbar
-from barpyrus import conky
+from barpyrus import sysinfo
 import sys
 
 # Copy this config to ~/.config/barpyrus/config.py
 
 # set up a connection to herbstluftwm in order to get events
-# and in order to call herbstclient commands
+# and in order to call herbstclient commands. With native_ipc=True,
+# commands are sent via python-xlib instead of running herbstclient, and
+# with native_hooks=True, hooks are read without 'herbstclient --idle'.
 hc = hlwm.connect()
 
 # get the geometry of the monitor
@@ -29,7 +31,7 @@ bar.widget = W.ListLayout([
     W.RawLabel('%{c}'),
     grey_frame(hlwm.HLWMWindowTitle(hc)),
     W.RawLabel('%{r}'),
-    conky.ConkyWidget('df /: ${fs_used_perc /}%'),
+    sysinfo.FilesystemUsage('/', 'df /: {used_perc:.0f}%'),
     grey_frame(W.DateTime('%d. %B, %H:%M')),
 ])
 
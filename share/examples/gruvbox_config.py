@@ -6,6 +6,7 @@ from barpyrus import widgets as W
 from barpyrus.core import Theme
 from barpyrus import lemonbar
 from barpyrus import conky
+from barpyrus import sysinfo
 from barpyrus.colors import (
     AQUA_LIGHT,
     GREEN_LIGHT,
@@ -38,11 +39,22 @@ mail_symb = '\ue1a8'
 inbox = os.path.expanduser('~/.mail/INBOX')
 mail = col_fmt(AQUA_LIGHT) + mail_symb + col_fmt(FG) + ' ${new_mails %s}/${mails %s}' % (inbox, inbox)
 
+# markup for the widgets that are not rendered by conky. The icons are
+# separate labels, so the format strings of the sysinfo widgets need no
+# escaping of the braces in the markup.
+def markup_fmt(color):
+    return '%{F' + color + '}'
+
+def icon(color, symbol):
+    return W.RawLabel(markup_fmt(color) + symbol + markup_fmt(FG))
+
 disk_symb = '\ue1bb'
-disk_usage = col_fmt(GREEN_LIGHT) + disk_symb + col_fmt(FG) + '${fs_free}/${fs_size}'
+disk_usage = sysinfo.FilesystemUsage('/', lambda fs:
+    markup_fmt(GREEN_LIGHT) + disk_symb + markup_fmt(FG)
+    + sysinfo.format_bytes(fs['free']) + '/' + sysinfo.format_bytes(fs['size']))
 
 on_symb = '\ue10c'
-uptime = col_fmt(GREEN_LIGHT) + on_symb + col_fmt(FG) + '${uptime_short}'
+uptime = W.ListLayout([icon(GREEN_LIGHT, on_symb), sysinfo.Uptime('{days}d {hours}h')])
 
 ##########
 # volume #
@@ -70,13 +82,15 @@ volume += col_fmt(FG) + '${pa_sink_volume}%'
 # various #
 ###########
 cpu_symb = '\ue026'
-cpu = col_fmt(PURPLE_LIGHT) + cpu_symb + col_fmt(FG) + '${cpu}%'
+cpu = W.ListLayout([icon(PURPLE_LIGHT, cpu_symb), sysinfo.CPU('{cpu:.0f}%')])
 ram_symb = '\ue021'
-ram = col_fmt(PURPLE_LIGHT) + ram_symb + col_fmt(FG) + '${memperc}%'
+ram = W.ListLayout([icon(PURPLE_LIGHT, ram_symb), sysinfo.Memory('{memperc:.0f}%')])
 net_down_speed_symb = '\ue13c'
-net_down_speed = col_fmt(RED_LIGHT) + net_down_speed_symb + col_fmt(FG) + '${downspeedf}K'
 net_up_speed_symb = '\ue13b'
-net_down_speed = col_fmt(GREEN_LIGHT) + net_up_speed_symb + col_fmt(FG) + '${upspeedf}K'
+# net_speed = W.ListLayout([
+#     icon(RED_LIGHT, net_down_speed_symb), sysinfo.NetSpeed(format = '{down:.1f}K '),
+#     icon(GREEN_LIGHT, net_up_speed_symb), sysinfo.NetSpeed(format = '{up:.1f}K'),
+# ])
 
 ########
 # wifi #
@@ -107,13 +121,6 @@ else:
 ###########
 # battery #
 ###########
-battery = "${if_existing /sys/class/power_supply/BAT0}"
-battery += "%{T2}"
-battery += "${if_match \"$battery\" == \"discharging $battery_percent%\"}"
-battery += col_fmt(ORANGE_LIGHT)
-battery += "$else"
-battery += col_fmt(GREEN_LIGHT)
-battery += "$endif"
 bat_icons = [
     0xe242, 0xe243, 0xe244, 0xe245, 0xe246,
     0xe247, 0xe248, 0xe249, 0xe24a, 0xe24b,
@@ -121,32 +128,31 @@ bat_icons = [
 # first icon: 0 percent
 # last icon: 100 percent
 bat_delta = 100 / len(bat_icons)
-for i, icon in enumerate(bat_icons[:-1]):
-    battery += "${if_match $battery_percent < %d}" % ((i+1)*bat_delta)
-    battery += chr(icon)
-    battery += "${else}"
-battery += chr(bat_icons[-1])  # icon for 100 percent
-for _ in bat_icons[:-1]:
-    battery += "${endif}"
-battery += "%{T-} $battery_percent%"
-battery += "${endif}"
+def battery_text(bat):
+    color = ORANGE_LIGHT if bat['status'] == 'Discharging' else GREEN_LIGHT
+    icon = bat_icons[min(int(bat['percent'] / bat_delta), len(bat_icons) - 1)]
+    return '%{T2}' + markup_fmt(color) + chr(icon) + '%{T-} ' + str(bat['percent']) + '%'
+battery = sysinfo.Battery('BAT0', battery_text)
 
 conky_elements = [
     custom,
     mail,
     wifi,
     volume,
-    disk_usage,
-    cpu,
-    ram,
-    # net_down_speed,
-    # net_up_speed,
-    battery,
-    uptime,
 ]
 
 conky_text = ' '.join(conky_elements) + ' '
 
+# the widgets reading /proc and /sys directly
+system_metrics = W.ListLayout([
+    disk_usage, W.RawLabel(' '),
+    cpu, W.RawLabel(' '),
+    ram, W.RawLabel(' '),
+    # net_speed, W.RawLabel(' '),
+    battery, W.RawLabel(' '),
+    uptime, W.RawLabel(' '),
+])
+
 
 # example options for the hlwm.HLWMLayoutSwitcher widget
 xkblayouts = [
@@ -186,6 +192,7 @@ bar.widget = W.ListLayout([
         text=conky_text,
         config={'update_interval': update_interval},
     ),
+    system_metrics,
     # something like a tabbed widget with the tab labels '>' and '<'
     W.ShortLongLayout(
         W.RawLabel(''),
@@ -0,0 +1,41 @@
+from barpyrus import hlwm
+from barpyrus import widgets as W
+from barpyrus.core import Theme
+from barpyrus import lemonbar
+from barpyrus import sysinfo
+
+# Copy this config to ~/.config/barpyrus/config.py
+#
+# This config creates one panel for every monitor, all driven by a single
+# barpyrus process. So start barpyrus only once and not once per monitor.
+# All panels share the connection to herbstluftwm, and the tag status of
+# all monitors is fetched in one query.
+
+# set up a connection to herbstluftwm in order to get events
+# and in order to call herbstclient commands
+hc = hlwm.connect()
+
+height = 16 # height of the panels
+
+# you can define custom themes
+grey_frame = Theme(bg = '#303030', fg = '#EFEFEF', padding = (3,3))
+
+def monitor_bar(monitor):
+    (x, y, monitor_w, monitor_h) = hc.monitor_rect(monitor)
+    hc(['pad', str(monitor), str(height)]) # get space for the panel
+    bar = lemonbar.Lemonbar(geometry = (x,y,monitor_w,height))
+    # every panel needs widgets of its own, because a widget caches its
+    # output for the panel that has drawn it last
+    bar.widget = W.ListLayout([
+        W.RawLabel('%{l}'),
+        hlwm.HLWMTags(hc, monitor),
+        W.RawLabel('%{c}'),
+        grey_frame(hlwm.HLWMWindowTitle(hc)),
+        W.RawLabel('%{r}'),
+        sysinfo.FilesystemUsage('/', 'df /: {used_perc:.0f}%'),
+        grey_frame(W.DateTime('%d. %B, %H:%M')),
+    ])
+    return bar
+
+# a list of bars instead of a single one
+bar = [ monitor_bar(m) for m in range(int(hc(['attr', 'monitors.count']))) ]